@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Loading time of a compiled domain artifact compared with parsing the
+definition, on a synthetic warehouse domain: a robot moving between
+locations (through doors) and picking and placing objects. Every action
+has its own preconditions, unless --repetitive is given.
+
+    python3 benchmarks/domain_load_benchmark.py --locations 40 --objects 30
+    python3 benchmarks/domain_load_benchmark.py --repetitive
+
+It can be run from the repository without installing yappla.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import yappla
+
+
+def build_definition(locations, objects, repetitive):
+    actions = {}
+    for i in range(locations):
+        for j in [(i + 1) % locations, (i + 7) % locations]:
+            door = f"door_{min(i, j)}_{max(i, j)}"
+            # the battery needed grows with the distance, unless repetitive
+            battery = 10 if repetitive else 10 + abs(i - j)
+            actions[f"move_{i}_{j}"] = {
+                "preconditions": f"robot_at == 'loc_{i}' and {door} == 'open' and battery >= {battery}",
+                "effects": [{"robot_at": f"loc_{j}"}],
+                "cost": 1 if repetitive else 1 + abs(i - j),
+            }
+        for k in range(objects):
+            weight = "light" if repetitive or (i + k) % 3 else "heavy"
+            actions[f"pick_{k}_{i}"] = {
+                "preconditions": f"robot_at == 'loc_{i}' and object_{k} == 'loc_{i}' and gripper == 'empty'"
+                + ("" if weight == "light" else f" and battery >= {20 + k % 7}"),
+                "effects": [{f"object_{k}": "in_gripper", "gripper": f"{weight}_{k}"}],
+            }
+            actions[f"place_{k}_{i}"] = {
+                "preconditions": f"robot_at == 'loc_{i}' and gripper == '{weight}_{k}'",
+                "effects": [{f"object_{k}": f"loc_{i}", "gripper": "empty"}],
+            }
+    constraints = [
+        {"conditions": f"object_{k} == 'in_gripper'", "constraint": "gripper != 'empty'"} for k in range(objects)
+    ]
+    return {
+        "actions": actions,
+        "variables": {
+            "robot_at": {"values": [f"loc_{i}" for i in range(locations)], "initial_value": "loc_0"},
+            "battery": {"values": list(range(101)), "initial_value": 100},
+        },
+        "constraints": constraints,
+    }
+
+
+def best_time(function, repetitions):
+    times = []
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YAPPLA compiled domain benchmark")
+    parser.add_argument("--locations", type=int, default=40)
+    parser.add_argument("--objects", type=int, default=30)
+    parser.add_argument("--repetitive", action="store_true", help="give the same shape to all the preconditions")
+    parser.add_argument("--repetitions", type=int, default=3)
+    args = parser.parse_args()
+    definition = build_definition(args.locations, args.objects, args.repetitive)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        compiled_path = os.path.join(tmp_dir, "domain.ydc")
+        yappla.Domain().load_from_dict(definition, compiled_path=compiled_path)
+        artifact_size = os.path.getsize(compiled_path)
+        parse_time = best_time(lambda: yappla.Domain().load_from_dict(definition), args.repetitions)
+        load_time = best_time(
+            lambda: yappla.Domain().load_from_dict(definition, compiled_path=compiled_path), args.repetitions
+        )
+
+    print(f"actions:     {len(definition['actions'])}, constraints: {len(definition['constraints'])}")
+    print(f"parsing:     {parse_time * 1000.0:.1f} ms")
+    print(f"loading:     {load_time * 1000.0:.1f} ms (speedup {parse_time / load_time:.2f}x)")
+    print(f"artifact:    {artifact_size / 1024.0:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Planner benchmarks on a synthetic domain: a set of lights that can be
+switched on and off (the goal is to switch all of them on), plus many
+state variables not touched by any action.
+
+    python3 benchmarks/planner_benchmark.py --lights 10 --variables 200
+    python3 benchmarks/planner_benchmark.py --threads 4 --queries 32
+
+The first one measures the overhead of the search trace, the second one the
+throughput of a single Planner shared by many threads (it scales with the
+threads only on free-threaded Python builds). They can be run from the
+repository without installing yappla.
+"""
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import yappla
+
+
+def build_domain(lights):
+    domain = yappla.Domain()
+    for i in range(lights):
+        domain.add_action(yappla.Action(f"switch_on_{i}", preconditions=f"not light_{i}", effects=[{f"light_{i}": True}]))
+        domain.add_action(yappla.Action(f"switch_off_{i}", preconditions=f"light_{i}", effects=[{f"light_{i}": False}]))
+    return domain
+
+
+def build_problem(lights, variables):
+    initial_state = yappla.State({f"variable_{i}": "value" for i in range(variables)})
+    initial_state.update({f"light_{i}": False for i in range(lights)})
+    goal = " and ".join(f"light_{i}" for i in range(lights))
+    return initial_state, goal
+
+
+def best_time(function, repetitions):
+    times = []
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start_time)
+    return min(times), result
+
+
+def count_materializations(function):
+    """Counts the DeltaStates fully materialized (i.e., copied) by `function`:
+    they should be only the ones of the plan (plus one every
+    `state_materialization_depth` actions), never one per generated state."""
+    materializations = 0
+    materialize = yappla.DeltaState._materialize
+
+    def counting_materialize(self):
+        nonlocal materializations
+        materializations += 1
+        return materialize(self)
+
+    yappla.DeltaState._materialize = counting_materialize
+    try:
+        planner_result = function()
+    finally:
+        yappla.DeltaState._materialize = materialize
+    assert materializations < planner_result.stats["iterations"], f"{materializations} states materialized"
+    return materializations
+
+
+def benchmark_trace(args):
+    planner = yappla.Planner()
+    planner.max_iterations = 10 ** 9
+    planner.set_domain(build_domain(args.lights))
+    initial_state, goal = build_problem(args.lights, args.variables)
+
+    plain_time, planner_result = best_time(lambda: planner.plan(initial_state, goal), args.repetitions)
+    materializations = count_materializations(lambda: planner.plan(initial_state, goal))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trace_path = os.path.join(tmp_dir, "trace.jsonl")
+
+        def plan_with_trace():
+            with yappla.SearchTraceWriter(trace_path) as trace:
+                return planner.plan(initial_state, goal, trace=trace)
+
+        trace_time, _ = best_time(plan_with_trace, args.repetitions)
+        trace_size = os.path.getsize(trace_path)
+        start_time = time.perf_counter()
+        trace = yappla.SearchTrace.load(trace_path)
+        trace.branching_factors()
+        trace.action_stats()
+        read_time = time.perf_counter() - start_time
+
+    iterations = planner_result.stats["iterations"]
+    print(f"expanded states:     {iterations}")
+    print(f"planning:            {plain_time * 1000.0:.1f} ms ({plain_time / iterations * 1e6:.1f} us per expansion)")
+    print(f"materialized states: {materializations}")
+    print(f"planning with trace: {trace_time * 1000.0:.1f} ms (overhead {(trace_time / plain_time - 1.0) * 100.0:.1f}%)")
+    print(f"trace:               {len(trace.records)} records, {trace_size / 1024.0:.1f} KiB, read in {read_time * 1000.0:.1f} ms")
+
+
+def benchmark_threads(args):
+    planner = yappla.Planner()
+    planner.max_iterations = 10 ** 9
+    planner.set_domain(build_domain(args.lights))
+    initial_state, _ = build_problem(args.lights, args.variables)
+    # different goals, to be sure the queries do not share anything
+    goals = [" and ".join(f"light_{j}" for j in range(args.lights) if j != i % args.lights) for i in range(args.queries)]
+    expected_lengths = [len(planner.plan(initial_state, goal).plan) for goal in goals]
+
+    for threads in sorted({1, args.threads}):
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            start_time = time.perf_counter()
+            planner_results = list(executor.map(lambda goal: planner.plan(initial_state, goal), goals))
+            elapsed_time = time.perf_counter() - start_time
+        assert [len(r.plan) for r in planner_results] == expected_lengths, "wrong plans with concurrent queries"
+        print(f"{threads} thread(s): {args.queries / elapsed_time:.1f} queries/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YAPPLA planner benchmarks")
+    parser.add_argument("--lights", type=int, default=10, help="number of lights (the search space has 2^lights states)")
+    parser.add_argument("--variables", type=int, default=200, help="number of state variables not touched by the actions")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="run the multi-threaded throughput benchmark")
+    parser.add_argument("--queries", type=int, default=32, help="number of queries of the multi-threaded benchmark")
+    args = parser.parse_args()
+    if args.threads > 0:
+        benchmark_threads(args)
+    else:
+        benchmark_trace(args)
+
+
+if __name__ == "__main__":
+    main()
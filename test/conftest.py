@@ -0,0 +1,44 @@
+import pytest
+
+import yappla
+
+
+FEET_SHOES_GOAL = "left_foot == 'has_shoe' and right_foot == 'has_shoe'"
+
+
+def build_feet_shoes_domain(left_cost: int = 10, right_cost: int = 10, variables: bool = False) -> yappla.Domain:
+    """The socks and shoes domain: a sock has to be put on a foot before its
+    shoe. With `variables`, the state variables (and their values) are part
+    of the domain too."""
+    domain = yappla.Domain()
+    for foot, cost in [("left", left_cost), ("right", right_cost)]:
+        if variables:
+            domain.add_variable(yappla.StateVariable(
+                f"{foot}_foot", values=["has_nothing", "has_sock", "has_shoe"], initial_value="has_nothing"))
+        domain.add_action(yappla.Action(
+            f"put_{foot}_sock",
+            preconditions=f"{foot}_foot == 'has_nothing'",
+            effects=[{f"{foot}_foot": "has_sock"}],
+            cost=cost))
+        domain.add_action(yappla.Action(
+            f"put_{foot}_shoe",
+            preconditions=f"{foot}_foot == 'has_sock'",
+            effects=[{f"{foot}_foot": "has_shoe"}],
+            cost=cost))
+    return domain
+
+
+@pytest.fixture
+def feet_shoes_domain():
+    """A factory of socks and shoes domains, see build_feet_shoes_domain."""
+    return build_feet_shoes_domain
+
+
+@pytest.fixture
+def feet_shoes_goal():
+    return FEET_SHOES_GOAL
+
+
+@pytest.fixture
+def feet_shoes_state():
+    return yappla.State({"left_foot": "has_nothing", "right_foot": "has_nothing"})
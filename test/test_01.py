@@ -37,3 +37,21 @@ def test_feet_shoes():
 
     assert planner_result.outcome == PlannerOutcome.SUCCESS
     assert len(planner_result.plan) == 5  # 4 actions + the final goal state without actions
+
+
+def test_feet_shoes_constraints(feet_shoes_domain, feet_shoes_goal, feet_shoes_state):
+    initial_state = feet_shoes_state
+    domain = feet_shoes_domain()
+    # the right shoe can be put on only after the left one
+    domain.add_constraint("left_foot == 'has_shoe'", conditions="right_foot == 'has_shoe'")
+    assert domain.constraints_on(["left_foot"]) == domain.constraints
+    assert domain.constraints_on(["weather"]) == []
+
+    planner = yappla.Planner()
+    planner.set_domain(domain)
+    planner_result = planner.plan(initial_state, feet_shoes_goal)
+
+    assert planner_result.outcome == PlannerOutcome.SUCCESS
+    actions = [p[1] for p in planner_result.plan]
+    assert actions.index("put_left_shoe") < actions.index("put_right_shoe")
+    assert planner_result.stats["pruned"] > 0
@@ -0,0 +1,89 @@
+import copy
+import os
+import pickle
+
+import yappla
+from yappla.plan import PlannerOutcome
+
+
+DEFINITION = {
+    "domain": {
+        "actions": {
+            "pick": {
+                "preconditions": "gripper == 'empty' and object == 'on_table'",
+                "effects": [{"gripper": "full", "object": "in_gripper"}],
+            },
+            "place": {
+                "preconditions": "gripper == 'full'",
+                "effects": [{"gripper": "empty", "object": "on_shelf"}],
+                "cost": 5,
+            },
+        },
+        "variables": {
+            "gripper": {"values": ["empty", "full"], "initial_value": "empty"},
+            "object": {"values": ["on_table", "in_gripper", "on_shelf"], "initial_value": "on_table"},
+        },
+        "constraints": [
+            {"conditions": "object == 'in_gripper'", "constraint": "gripper == 'full'"},
+        ],
+    }
+}
+
+
+def test_compiled_domain(tmp_path):
+    compiled_path = str(tmp_path / "domain.ydc")
+    domain = yappla.Domain()
+    domain.load_from_dict(DEFINITION, compiled_path=compiled_path)
+    assert os.path.exists(compiled_path)
+    # saving leaves the domain as it is
+    preconditions = domain.action("pick").compiled_preconditions
+    tree = preconditions.compiled_ast_tree
+    domain.save_compiled(compiled_path)
+    assert domain.action("pick").compiled_preconditions.compiled_ast_tree is tree
+
+    cached = yappla.Domain()
+    cached.load_from_dict(DEFINITION, compiled_path=compiled_path)
+    assert cached.to_dict() == domain.to_dict()
+    assert len(cached.constraints_on(["gripper"])) == 1
+    assert cached.action("pick").compiled_preconditions.variables == {"gripper", "object"}
+
+    planner = yappla.Planner()
+    planner.set_domain(cached)
+    planner_result = planner.plan(cached.get_initial_state(), "object == 'on_shelf'")
+    assert planner_result.outcome == PlannerOutcome.SUCCESS
+    assert len(planner_result.plan) == 3
+
+    # a changed definition makes the artifact stale
+    definition = copy.deepcopy(DEFINITION)
+    definition["domain"]["actions"]["place"]["cost"] = 7
+    assert yappla.Domain.load_compiled(compiled_path, yappla.utils.definition_hash(definition["domain"])) is None
+    changed = yappla.Domain()
+    changed.load_from_dict(definition, compiled_path=compiled_path)
+    assert changed.action("place").cost == 7
+
+
+def test_compiled_domain_expressions(tmp_path):
+    definition = {
+        "actions": {
+            f"action_{i}": {
+                "preconditions": f"robot_at == 'loc_{i % 40}' and gripper == 'empty' and door_{i % 10} == 'open'",
+                "effects": [{"robot_at": f"loc_{(i + 1) % 40}"}],
+            }
+            for i in range(100)
+        },
+        "variables": {"robot_at": {"values": [f"loc_{i}" for i in range(40)], "initial_value": "loc_0"}},
+    }
+    compiled_path = str(tmp_path / "domain.ydc")
+    yappla.Domain().load_from_dict(definition, compiled_path=compiled_path)
+
+    # the loaded domain uses the stored variables as they are
+    cached = yappla.Domain()
+    cached.load_from_dict(definition, compiled_path=compiled_path)
+    preconditions = cached.action("action_0").compiled_preconditions
+    assert preconditions.variables == {"robot_at", "gripper", "door_0"}
+    assert preconditions.eval_in_state({"robot_at": "loc_0", "gripper": "empty", "door_0": "open"})
+    assert not preconditions.eval_in_state({"robot_at": "loc_0", "gripper": "full", "door_0": "open"})
+
+    # the custom functions of an expression are kept when it is stored
+    expression = yappla.utils.CompiledExpression("absolute(x) == 4", functions={"absolute": abs})
+    assert pickle.loads(pickle.dumps(expression)).eval_in_state({"x": -4})
@@ -0,0 +1,66 @@
+import pytest
+
+import yappla
+from yappla import MonitorOutcome
+
+
+def test_monitor(feet_shoes_domain, feet_shoes_goal):
+    planner = yappla.Planner()
+    planner.set_domain(feet_shoes_domain())
+    planner.set_goal(feet_shoes_goal)
+    initial_state = yappla.State({"left_foot": "has_nothing", "right_foot": "has_nothing", "weather": "sunny"})
+    planner_result = planner.plan(initial_state)
+    monitor = yappla.PlanMonitor(planner, planner_result)
+    replanning_monitor = yappla.PlanMonitor(planner, planner_result, repair_max_depth=0)
+
+    # a variable not read by any action does not invalidate the plan
+    state = yappla.State(initial_state, weather="rainy")
+    assert monitor.update(state) == MonitorOutcome.VALID
+    assert monitor.step == 0
+
+    state = planner.apply_action_to_state(monitor.next_action, state)
+    assert monitor.update(state) == MonitorOutcome.VALID
+    assert monitor.step == 1
+    assert replanning_monitor.update(state) == MonitorOutcome.VALID
+
+    # the sock fell off: the rest of the plan can be rejoined by putting it on again
+    lost_sock_state = yappla.State(state, left_foot="has_nothing")
+    assert monitor.update(lost_sock_state) == MonitorOutcome.REPAIRED
+    assert monitor.next_action == "put_left_sock"
+    assert len(monitor.plan) == len(planner_result.plan)
+    assert replanning_monitor.update(lost_sock_state) == MonitorOutcome.REPLANNED
+
+    state = lost_sock_state
+    outcome = None
+    while monitor.next_action is not None:
+        state = planner.apply_action_to_state(monitor.next_action, state)
+        outcome = monitor.update(state)
+        assert outcome in [MonitorOutcome.VALID, MonitorOutcome.GOAL_REACHED]
+    assert outcome == MonitorOutcome.GOAL_REACHED
+    assert monitor.stats["repairs"] == 1
+    assert monitor.stats["replans"] == 0
+
+    # only the results with a plan and a goal can be monitored
+    planner_result.goal = None
+    with pytest.raises(ValueError):
+        yappla.PlanMonitor(planner, planner_result)
+
+
+def test_monitor_constraints():
+    domain = yappla.Domain()
+    domain.add_action(yappla.Action(
+        "open_door", preconditions="door == 'closed'", effects=[{"door": "open"}], cost=1))
+    domain.add_action(yappla.Action("turn_on_light", effects=[{"light": True}], cost=1))
+    domain.add_constraint("light", conditions="door == 'open'")
+    planner = yappla.Planner()
+    planner.set_domain(domain)
+    planner.set_goal("door == 'open'")
+    initial_state = yappla.State({"door": "closed", "light": True})
+    planner_result = planner.plan(initial_state)
+    assert [action for _, action in planner_result.plan[:-1]] == ["open_door"]
+    monitor = yappla.PlanMonitor(planner, planner_result)
+
+    # opening the door with the light off would violate the constraint
+    dark_state = yappla.State(initial_state, light=False)
+    assert monitor.update(dark_state) != MonitorOutcome.VALID
+    assert monitor.next_action == "turn_on_light"
@@ -0,0 +1,82 @@
+import asyncio
+import concurrent.futures
+
+import pytest
+
+import yappla
+from yappla.plan import PlannerOutcome
+
+
+def _counter_planner(limit):
+    domain = yappla.Domain()
+    for i in range(limit):
+        domain.add_action(yappla.Action(
+            f"increment_{i}", preconditions=f"counter == {i}", effects=[{"counter": i + 1}], cost=1))
+    planner = yappla.Planner()
+    planner.set_domain(domain)
+    return planner
+
+
+def test_plan_async():
+    planner = _counter_planner(50)
+    progress = []
+
+    async def plan():
+        # without a yield_interval, the progress is reported only every
+        # yield_every expansions, however slow they are
+        return await planner.plan_async(
+            yappla.State({"counter": 0}), "counter == 50", yield_every=10, yield_interval=float("inf"),
+            progress_callback=progress.append)
+
+    planner_result = asyncio.run(plan())
+    assert planner_result.outcome == PlannerOutcome.SUCCESS
+    assert len(planner_result.plan) == 51
+    assert [p["iterations"] for p in progress] == [10, 20, 30, 40, 50]
+
+    async def plan_in_thread(executor):
+        return await planner.plan_async(yappla.State({"counter": 0}), "counter == 50", executor=executor)
+
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        planner_result = asyncio.run(plan_in_thread(executor))
+    assert planner_result.outcome == PlannerOutcome.SUCCESS
+
+    # the trace and the progress cannot be sent back from another process
+    async def plan_in_process(executor):
+        return await planner.plan_async(
+            yappla.State({"counter": 0}), "counter == 50", executor=executor, progress_callback=progress.append)
+
+    with concurrent.futures.ProcessPoolExecutor(1) as executor:
+        with pytest.raises(ValueError):
+            asyncio.run(plan_in_process(executor))
+
+
+def test_plan_async_cancel():
+    domain = yappla.Domain()
+    for i in range(20):
+        domain.add_action(yappla.Action(f"switch_on_{i}", preconditions=f"not light_{i}", effects=[{f"light_{i}": True}]))
+    planner = yappla.Planner()
+    planner.set_domain(domain)
+    planner.max_iterations = 10 ** 9
+    heartbeats = []
+
+    async def heartbeat():
+        while True:
+            heartbeats.append(1)
+            await asyncio.sleep(0)
+
+    async def plan():
+        heartbeat_task = asyncio.create_task(heartbeat())
+        # unreachable goal, the search would take forever
+        plan_task = asyncio.create_task(
+            planner.plan_async(yappla.State({f"light_{i}": False for i in range(20)}), "False", yield_every=1))
+        await asyncio.sleep(0.05)
+        plan_task.cancel()
+        heartbeat_task.cancel()
+        try:
+            await plan_task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(plan())
+    assert len(heartbeats) > 1
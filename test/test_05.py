@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+
+import yappla
+from yappla.plan import PlannerOutcome
+from yappla.service import PlanningServer, PlanningClient
+
+
+def wait_for_socket(socket_path, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(socket_path):
+        assert time.monotonic() < deadline, "the planning server did not start"
+        time.sleep(0.01)
+
+
+def test_planning_service(tmp_path, feet_shoes_domain, feet_shoes_goal):
+    domain = feet_shoes_domain(variables=True)
+    socket_path = str(tmp_path / "yappla.sock")
+    server = PlanningServer(socket_path, {"feet": domain}, workers=2)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+    try:
+        wait_for_socket(socket_path)
+        with PlanningClient(socket_path) as client:
+            planner_result = client.plan(
+                "feet", domain.get_initial_state(), feet_shoes_goal)
+            assert planner_result.outcome == PlannerOutcome.SUCCESS
+            assert len(planner_result.plan) == 5
+            assert isinstance(planner_result.plan[0][0], yappla.State)
+
+            planner_result = client.plan("feet", domain.get_initial_state(), "left_foot == 'has_nothing'")
+            assert planner_result.outcome == PlannerOutcome.ALREADY_AT_GOAL
+
+            try:
+                client.plan("hands", domain.get_initial_state(), "True")
+                assert False
+            except RuntimeError as exc:
+                assert "hands" in str(exc)
+
+            stats = client.stats()
+            assert stats["requests"] == 2
+            assert stats["errors"] == 1
+            assert stats["outcomes"] == {"SUCCESS": 1, "ALREADY_AT_GOAL": 1}
+            assert stats["latency"]["max"] > 0
+    finally:
+        server.shutdown()
+        server_thread.join()
+    assert not os.path.exists(socket_path)
+
+
+def test_planning_service_deadline(tmp_path):
+    domain = yappla.Domain()
+    for i in range(16):
+        domain.add_action(yappla.Action(f"switch_on_{i}", preconditions=f"not light_{i}", effects=[{f"light_{i}": True}]))
+    initial_state = yappla.State({f"light_{i}": False for i in range(16)})
+    socket_path = str(tmp_path / "yappla.sock")
+    server = PlanningServer(socket_path, {"lights": domain}, workers=1)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+    try:
+        wait_for_socket(socket_path)
+        # the only worker is busy with an unreachable goal
+        def plan_unreachable_goal():
+            with PlanningClient(socket_path) as client:
+                client.plan("lights", initial_state, "False", timeout=1.0)
+
+        busy_thread = threading.Thread(target=plan_unreachable_goal)
+        busy_thread.start()
+        time.sleep(0.1)
+        with PlanningClient(socket_path) as client:
+            start_time = time.monotonic()
+            planner_result = client.plan("lights", initial_state, "light_0", timeout=0.2)
+            assert planner_result.outcome == PlannerOutcome.TIMEOUT
+            assert time.monotonic() - start_time < 0.6
+        busy_thread.join()
+    finally:
+        server.shutdown()
+        server_thread.join()
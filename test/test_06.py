@@ -0,0 +1,51 @@
+import yappla
+from yappla import DeltaState
+
+
+def test_delta_state():
+    state = yappla.State({f"var_{i}": "a" for i in range(10)})
+    delta_state = DeltaState(state, max_depth=3)
+    assert delta_state == state
+    assert hash(delta_state) == hash(DeltaState(yappla.State(state)))
+    assert delta_state.hash() == state.hash()
+
+    assert delta_state.apply({"var_0": "a"}) is delta_state
+    new_state = delta_state
+    for i in range(5):
+        new_state = new_state.apply({f"var_{i}": "b"})
+        expected_state = yappla.State(state, **{f"var_{j}": "b" for j in range(i + 1)})
+        assert new_state == expected_state
+        assert new_state.to_state() == expected_state
+        assert hash(new_state) == hash(DeltaState(expected_state))
+    # the chain of parents is cut every max_depth states
+    assert new_state._depth < 3
+
+    # same state reached through different paths
+    other_state = delta_state.apply({"var_1": "b"}).apply({"var_0": "b"})
+    assert other_state == delta_state.apply({"var_0": "b"}).apply({"var_1": "b"})
+    assert len({other_state, delta_state.apply({"var_0": "b", "var_1": "b"})}) == 1
+    assert other_state != delta_state
+    assert other_state.apply({"var_2": "c"})["var_2"] == "c"
+    assert other_state.satisfies_conditions("var_0 == 'b' and var_9 == 'a'")
+
+
+def test_delta_state_equality_does_not_materialize(monkeypatch):
+    materializations = []
+    materialize = DeltaState._materialize
+    monkeypatch.setattr(DeltaState, "_materialize", lambda self: materializations.append(self) or materialize(self))
+
+    state = DeltaState({f"var_{i}": "a" for i in range(100)}, max_depth=2)
+    # common ancestor
+    assert state.apply({"var_1": "b"}).apply({"var_0": "b"}) == state.apply({"var_0": "b"}).apply({"var_1": "b"})
+    assert state.apply({"var_1": "b"}) != state.apply({"var_0": "b"})
+    assert not materializations
+
+    # different (materialized) roots
+    left = state.apply({"var_0": "b"}).apply({"var_1": "b"}).apply({"var_2": "b"}).apply({"var_3": "b"})
+    right = state.apply({"var_3": "b"}).apply({"var_2": "b"}).apply({"var_1": "b"}).apply({"var_0": "b"})
+    assert left._chain()[-1] is not right._chain()[-1]
+    materializations.clear()
+    assert left == right
+    assert left != right.apply({"var_4": "b"})
+    assert left != right.apply({"new_var": "b"})
+    assert not materializations
@@ -0,0 +1,35 @@
+import io
+
+import pytest
+
+import yappla
+from yappla import SearchTrace, SearchTraceWriter
+
+
+def test_search_trace(feet_shoes_domain, feet_shoes_goal, feet_shoes_state):
+    planner = yappla.Planner()
+    planner.set_domain(feet_shoes_domain())
+
+    stream = io.StringIO()
+    trace_writer = SearchTraceWriter(stream, buffer_records=3)
+    planner_result = planner.plan(feet_shoes_state, feet_shoes_goal, trace=trace_writer)
+    trace_writer.close()
+
+    stream.seek(0)
+    trace = SearchTrace.load(stream)
+    assert trace.header["goal"] == feet_shoes_goal
+    assert len(trace.expanded) == planner_result.stats["iterations"]
+    goal_state = planner_result.plan[-1][0]
+    goal_id = hash(yappla.DeltaState(goal_state))
+    assert trace.expanded[-1] == goal_id
+    assert trace.path(goal_id) == [p[1] for p in planner_result.plan[:-1]]
+    assert trace.depth(goal_id) == 4
+    assert trace.branching_factors()[0] == 2
+    action_stats = trace.action_stats()
+    # 3 x 3 states, the initial one is not generated by any action
+    assert sum(s["generated"] for s in action_stats.values()) == 8
+    assert sum(s["duplicates"] for s in action_stats.values()) > 0
+
+    # a writer cannot be reused for another search
+    with pytest.raises(RuntimeError):
+        planner.plan(feet_shoes_state, "True", trace=trace_writer)
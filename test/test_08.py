@@ -0,0 +1,29 @@
+import yappla
+from yappla.plan import PlannerOutcome
+
+
+def test_plan_multi(feet_shoes_domain, feet_shoes_state):
+    planner = yappla.Planner()
+    planner.set_domain(feet_shoes_domain(left_cost=10, right_cost=20))
+    initial_state = feet_shoes_state
+    goals = {
+        "nothing": "left_foot == 'has_nothing'",
+        "left": "left_foot == 'has_shoe'",
+        "right": "right_foot == 'has_shoe'",
+        "both": "left_foot == 'has_shoe' and right_foot == 'has_shoe'",
+        "barefoot": "left_foot == 'has_shoe' and right_foot == 'has_nothing' and left_foot == 'has_nothing'",
+    }
+
+    planner_results = planner.plan_multi(initial_state, goals)
+    assert planner_results["nothing"].outcome == PlannerOutcome.ALREADY_AT_GOAL
+    assert planner_results["barefoot"].outcome == PlannerOutcome.FAILURE
+    for name in ["left", "right", "both"]:
+        planner_result = planner.plan(initial_state, goals[name])
+        assert planner_results[name].outcome == PlannerOutcome.SUCCESS
+        assert planner_results[name].stats["cost"] == planner_result.stats["cost"]
+        assert len(planner_results[name].plan) == len(planner_result.plan)
+    assert planner_results["both"].stats["cost"] == 60
+
+    planner_results = planner.plan_multi(initial_state, [goals["left"], goals["right"]], cost_bound=30)
+    assert planner_results[0].outcome == PlannerOutcome.SUCCESS
+    assert planner_results[1].outcome == PlannerOutcome.FAILURE
@@ -0,0 +1,93 @@
+import concurrent.futures
+import sys
+
+import yappla
+from yappla.plan import PlannerOutcome
+
+
+def test_concurrent_planning():
+    domain = yappla.Domain()
+    for i in range(6):
+        domain.add_action(yappla.Action(f"switch_on_{i}", preconditions=f"not light_{i}", effects=[{f"light_{i}": True}]))
+        domain.add_action(yappla.Action(f"switch_off_{i}", preconditions=f"light_{i}", effects=[{f"light_{i}": False}]))
+    planner = yappla.Planner()
+    planner.set_domain(domain)
+    planner.set_goal("light_5")
+    initial_state = yappla.State({f"light_{i}": False for i in range(6)})
+    goals = [" and ".join(f"light_{j}" for j in range(i + 1)) for i in range(6)]
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # make the threads interleave as much as possible
+    try:
+        with concurrent.futures.ThreadPoolExecutor(6) as executor:
+            futures = [executor.submit(planner.plan, initial_state, goals[i % 6]) for i in range(60)]
+            planner_results = [f.result() for f in futures]
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    for i, planner_result in enumerate(planner_results):
+        assert planner_result.outcome == PlannerOutcome.SUCCESS
+        assert planner_result.goal == goals[i % 6]
+        assert len(planner_result.plan) == i % 6 + 2
+    # the goals of the queries do not replace the one set with set_goal
+    planner_result = planner.plan(initial_state)
+    assert planner_result.goal == "light_5"
+    assert [a for _, a in planner_result.plan] == ["switch_on_5", None]
+
+
+def test_concurrent_evaluation():
+    expr = yappla.CompiledExpression("a == b and b == a")
+
+    def evaluate(i):
+        state = yappla.State({"a": i, "b": i if i % 2 else -i})
+        return all(bool(expr.eval_in_state(state)) == bool(i % 2 or i == 0) for _ in range(2000))
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            assert all(executor.map(evaluate, range(16)))
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+def test_planning_does_not_modify_the_domain():
+    domain = yappla.Domain()
+    domain.add_action(yappla.Action("switch_on", preconditions="not light", effects=[{"light": True}]))
+    domain.add_action(yappla.Action("open_door", preconditions="light", effects=[{"door": "open", "light": False}]))
+    domain.add_constraint("light", conditions="door == 'open'")
+    planner = yappla.Planner()
+    planner.set_domain(domain)
+    # the constraints to check after each effect are already known
+    constraints = domain.constraints_on(["door", "light"])
+    assert len(constraints) == 1
+
+    planner_result = planner.plan(yappla.State({"light": False, "door": "closed"}), "door == 'open'")
+    assert planner_result.outcome == PlannerOutcome.FAILURE
+    assert planner_result.stats["pruned"] == 1
+    assert domain.constraints_on(["light", "door"]) is constraints
+
+
+def test_many_constraints(monkeypatch):
+    searches = []
+    find_constraints = yappla.Domain._find_constraints
+    monkeypatch.setattr(
+        yappla.Domain, "_find_constraints", lambda self, key: searches.append(key) or find_constraints(self, key))
+    definition = {
+        "actions": {
+            f"move_{i}": {"preconditions": f"robot == 'loc_{i}'", "effects": [{"robot": f"loc_{i + 1}", f"item_{i % 100}": "moved"}]}
+            for i in range(1000)
+        },
+        "variables": {},
+        "constraints": [
+            {"conditions": f"item_{i % 100} == 'moved'", "constraint": f"robot != 'loc_{i}'"} for i in range(300)
+        ],
+    }
+    domain = yappla.Domain()
+    domain.load_from_dict(definition)
+    # each set of variables changed by an effect is searched once, not once per constraint
+    assert len(searches) == 100
+    for i in [0, 42, 99]:
+        expected = [c for c in domain.constraints if {"robot", f"item_{i}"} & (c["conditions"].variables | c["constraint"].variables)]
+        assert domain.constraints_on({"robot", f"item_{i}"}) == expected
+        assert len(expected) == 300
@@ -0,0 +1,88 @@
+import pytest
+
+import yappla
+from yappla.plan import PlannerOutcome
+from yappla.pdb import PatternDatabaseHeuristic, select_patterns, variable_values
+
+
+@pytest.fixture
+def domain(feet_shoes_domain):
+    domain = feet_shoes_domain(left_cost=10, right_cost=20, variables=True)
+    # the shoes can be put on only with the light on
+    for foot, cost in [("left", 10), ("right", 20)]:
+        domain.add_action(yappla.Action(
+            f"put_{foot}_shoe",
+            preconditions=f"{foot}_foot == 'has_sock' and light",
+            effects=[{f"{foot}_foot": "has_shoe"}],
+            cost=cost))
+    domain.add_variable(yappla.StateVariable("light", values=[False, True], initial_value=False))
+    domain.add_action(yappla.Action("switch_on", preconditions="not light", effects=[{"light": True}], cost=5))
+    for i in range(4):
+        domain.add_variable(yappla.StateVariable(f"drawer_{i}", values=[False, True], initial_value=False))
+        domain.add_action(yappla.Action(f"open_drawer_{i}", preconditions=f"not drawer_{i}", effects=[{f"drawer_{i}": True}]))
+        domain.add_action(yappla.Action(f"close_drawer_{i}", preconditions=f"drawer_{i}", effects=[{f"drawer_{i}": False}]))
+    return domain
+
+
+def test_select_patterns(domain, feet_shoes_goal):
+    patterns = select_patterns(domain, feet_shoes_goal, variable_values(domain), max_size=6)
+    assert patterns == [("left_foot", "light"), ("right_foot",)]
+
+
+def test_pdb_heuristic(domain, feet_shoes_goal):
+    planner = yappla.Planner()
+    planner.set_domain(domain)
+    initial_state = domain.get_initial_state()
+
+    heuristic = PatternDatabaseHeuristic.build(domain, feet_shoes_goal)
+    assert [pdb.pattern for pdb in heuristic.pdbs] == [("left_foot", "light"), ("right_foot",)]
+    assert heuristic.combine == "add"
+    assert heuristic(initial_state) == 65
+    assert heuristic(yappla.State({**initial_state, "left_foot": "has_shoe", "right_foot": "has_shoe"})) == 0
+
+    heuristic_max = PatternDatabaseHeuristic.build(domain, feet_shoes_goal, patterns=[["left_foot", "light"], ["right_foot", "light"]])
+    assert heuristic_max.combine == "max"
+    assert heuristic_max(initial_state) == 45
+
+    blind_result = planner.plan(initial_state, feet_shoes_goal)
+    pdb_result = planner.plan(initial_state, feet_shoes_goal, heuristic=heuristic)
+    assert pdb_result.outcome == PlannerOutcome.SUCCESS
+    assert pdb_result.stats["cost"] == blind_result.stats["cost"] == 65
+    assert pdb_result.stats["iterations"] < blind_result.stats["iterations"]
+
+    # a goal that cannot be reached is detected without searching
+    heuristic = PatternDatabaseHeuristic.build(domain, "left_foot == 'has_nothing' and light")
+    assert heuristic(yappla.State({**initial_state, "left_foot": "has_sock"})) == float("inf")
+
+    # a heuristic built for another goal is rejected
+    with pytest.raises(ValueError):
+        planner.plan(initial_state, "drawer_0", heuristic=heuristic)
+    assert planner.plan(initial_state, "drawer_0").outcome == PlannerOutcome.SUCCESS
+
+
+def test_pdb_save_load(tmp_path, domain, feet_shoes_goal):
+    path = str(tmp_path / "feet.pdb")
+    heuristic = PatternDatabaseHeuristic.load_or_build(path, domain, feet_shoes_goal)
+    loaded = PatternDatabaseHeuristic.load(path, domain, feet_shoes_goal)
+    assert loaded is not None
+    assert loaded.combine == heuristic.combine
+    assert [pdb.pattern for pdb in loaded.pdbs] == [pdb.pattern for pdb in heuristic.pdbs]
+    assert [list(pdb.table) for pdb in loaded.pdbs] == [list(pdb.table) for pdb in heuristic.pdbs]
+    initial_state = domain.get_initial_state()
+    assert loaded(initial_state) == heuristic(initial_state)
+
+    # stale files are ignored and rebuilt
+    assert PatternDatabaseHeuristic.load(path, domain, "left_foot == 'has_shoe'") is None
+    domain.add_action(yappla.Action("buy_shoes", effects=[{"left_foot": "has_shoe"}], cost=1))
+    assert PatternDatabaseHeuristic.load(path, domain, feet_shoes_goal) is None
+    heuristic = PatternDatabaseHeuristic.load_or_build(path, domain, feet_shoes_goal)
+    assert PatternDatabaseHeuristic.load(path, domain, feet_shoes_goal) is not None
+
+    # so are the files built with other arguments
+    patterns = [["left_foot"], ["right_foot"]]
+    assert PatternDatabaseHeuristic.load(path, domain, feet_shoes_goal, patterns=patterns) is None
+    heuristic = PatternDatabaseHeuristic.load_or_build(path, domain, feet_shoes_goal, patterns=patterns)
+    assert [pdb.pattern for pdb in heuristic.pdbs] == [("left_foot",), ("right_foot",)]
+    assert PatternDatabaseHeuristic.load(path, domain, feet_shoes_goal, patterns=patterns) is not None
+    assert PatternDatabaseHeuristic.load(path, domain, feet_shoes_goal, patterns=patterns, max_size=10) is None
+    assert PatternDatabaseHeuristic.load(path, domain, feet_shoes_goal, patterns=patterns, initial_state=initial_state) is None
@@ -21,7 +21,8 @@ from yappla import (
     Planner as YPlanner,
     State as YState,
     Action as YAction,
-    Domain as YDomain
+    Domain as YDomain,
+    PlannerOutcome as YPlannerOutcome
 )
 
 
@@ -159,13 +160,20 @@ class EngineImpl(engines.Engine, engines.mixins.OneshotPlannerMixin):
         print("CURRENT GOAL", problem.goals[0])
         ygoal = self._fnode_to_python_expression(problem.goals[0])
         #ygoal = CompiledExpression(ygoal)
-        planner_result = yplanner.plan(init_ystate, ygoal)
+        planner_result = yplanner.plan(init_ystate, ygoal, timeout)
 
         # convert the YAPPLA result to UP result
-        res = engines.PlanGenerationResultStatus.UNSOLVABLE_PROVEN if planner_result.plan is None else engines.PlanGenerationResultStatus.SOLVED_SATISFICING
-        expected_state_list, action_list = zip(*planner_result.plan)
-        action_list = [up.plans.ActionInstance(problem.action(action_name)) for action_name in action_list if action_name is not None]
-        plan = SequentialPlanWithExpectedStates(expected_state_list, action_list)
+        if planner_result.outcome == YPlannerOutcome.TIMEOUT:
+            res = engines.PlanGenerationResultStatus.TIMEOUT
+        elif planner_result.plan is None:
+            res = engines.PlanGenerationResultStatus.UNSOLVABLE_PROVEN
+        else:
+            res = engines.PlanGenerationResultStatus.SOLVED_SATISFICING
+        plan = None
+        if planner_result.plan is not None:
+            expected_state_list, action_list = zip(*planner_result.plan)
+            action_list = [up.plans.ActionInstance(problem.action(action_name)) for action_name in action_list if action_name is not None]
+            plan = SequentialPlanWithExpectedStates(expected_state_list, action_list)
         ret = engines.PlanGenerationResult(res, plan, self.name)
         ret.metrics = {"stats": planner_result.stats}
         return ret
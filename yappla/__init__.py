@@ -5,9 +5,16 @@ from .plan import Plan
 from .plan import PlannerResult
 from .plan import PlannerOutcome
 from .state import State
+from .state import DeltaState
 from .state_variable import StateVariable
 from .domain import Domain
 from .planner import Planner
+from .monitor import PlanMonitor
+from .monitor import MonitorOutcome
+from .trace import SearchTraceWriter
+from .trace import SearchTrace
+from .pdb import PatternDatabase
+from .pdb import PatternDatabaseHeuristic
 
 import subprocess
 import re
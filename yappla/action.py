@@ -1,7 +1,7 @@
 from typing import List, Union, Dict
 
-from .utils import bc, eval_expression
-from .state import State
+from .utils import bc, CompiledExpression
+from .state import State, DeltaState
 
 
 class Action:
@@ -17,14 +17,20 @@ class Action:
     """
 
     def __init__(
-        self, name: str, preconditions: str = "", effects: Union[List, Dict] = None, cost: int = 10
+        self,
+        name: str,
+        preconditions: Union[str, CompiledExpression] = "",
+        effects: Union[List, Dict] = None,
+        cost: int = 10,
     ):
         """Constructor
 
         Args:
             name (str): the name of the operator
             preconditions (str): an expression specifying the preconditions that
-                have to hold to apply this operator
+                have to hold to apply this operator (either a string or an
+                already CompiledExpression), an empty expression means that
+                the operator is always applicable
             effects (list): a list of dicts containing the (expected) effects of the
                 application of this operator, for each variable name, the
                 dict contains either a string with the expected value or
@@ -34,7 +40,14 @@ class Action:
                 an action
         """
         self.name = name
-        self._preconditions = preconditions
+        if isinstance(preconditions, CompiledExpression):
+            self._preconditions = preconditions.expression
+            self._compiled_preconditions = preconditions
+        else:
+            self._preconditions = preconditions
+            self._compiled_preconditions = (
+                CompiledExpression(preconditions) if preconditions and preconditions.strip() else None
+            )
         if effects is None:
             self._effects = None
         elif isinstance(effects, list):
@@ -61,6 +74,12 @@ class Action:
         """Get the (pre-)preconditions for this operator."""
         return self._preconditions
 
+    @property
+    def compiled_preconditions(self) -> CompiledExpression:
+        """Get the compiled (pre-)preconditions for this operator, None if the
+        operator has no preconditions."""
+        return self._compiled_preconditions
+
     @property
     def effects(self) -> list:
         """Get the effects of this operator."""
@@ -68,20 +87,25 @@ class Action:
 
     def applicable(self, state: "State") -> bool:
         """Returns True if the operator can be applied in the state `state`."""
-        return eval_expression(self._preconditions, state)
+        if self._compiled_preconditions is None:
+            return True
+        return self._compiled_preconditions.eval_in_state(state)
 
     def possible_outcomes(self, state: "State", verbose: bool = False) -> List[State]:
         """Returns a list of possible states that would result by applying
-        the operator to the state provided as parameter.
+        the operator to the state provided as parameter (DeltaStates if the
+        state is a DeltaState, States otherwise).
         """
-        state = State(state)
         eff = self.effects
         new_states = []
         if verbose:
             print(f"Applying action operator {bc.CYAN}{self.name}{bc.ENDC} with cost {self.cost} and effects {eff}")
             print(f"  (O) {state.pretty_str()}")
         for e in eff:
-            new_state = State({**state, **e})
+            if isinstance(state, DeltaState):
+                new_state = state.apply(e)
+            else:
+                new_state = State({**state, **e})
             if verbose:
                 print(f"  --> {new_state.pretty_str()}")
             new_states.append(new_state)
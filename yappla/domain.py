@@ -1,16 +1,27 @@
-from typing import Dict
+import copy
+from typing import Dict, FrozenSet, Iterable, List, Optional, Union
 
 from yappla import Action
 from yappla import StateVariable
 from yappla import State
+from .utils import CompiledExpression, definition_hash, load_artifact, save_artifact, share_subtrees
+
+
+# bump this every time the content of the compiled domain artifact changes
+COMPILED_DOMAIN_FORMAT_VERSION = 5
 
 
 class Domain:
-    """ A domain contains the definition of the state variables and the actions. """
+    """ A domain contains the definition of the state variables, the actions
+    and the constraints that every valid state has to satisfy. """
 
     def __init__(self):
         self._actions = {}
         self._variables = {}
+        self._constraints = []
+        self._constraints_by_variable = {}
+        self._constraints_cache = {}  # variables changed by an effect -> constraints on them
+        self._cache_keys_by_variable = {}
 
     def action(self, name) -> Action:
         return self._actions.get(name, None)
@@ -21,6 +32,7 @@ class Domain:
 
     def add_action(self, action: Action):
         self._actions[action.name] = action
+        self._index_constraints(action)
 
     def variable(self, name) -> StateVariable:
         return self._variables.get(name, None)
@@ -32,6 +44,56 @@ class Domain:
     def add_variable(self, variable: StateVariable):
         self._variables[variable.name] = variable
 
+    @property
+    def constraints(self) -> List[Dict]:
+        """The constraints of the domain, in the format accepted by
+        `State.satisfies_constraints`."""
+        return self._constraints
+
+    def add_constraint(self, constraint: Union[str, CompiledExpression], conditions: Union[str, CompiledExpression] = "True"):
+        """Adds a constraint, i.e. an expression that has to hold in every
+        state in which the `conditions` hold; states violating it are never
+        generated by the planner."""
+        if not isinstance(constraint, CompiledExpression):
+            constraint = CompiledExpression(constraint)
+        if not isinstance(conditions, CompiledExpression):
+            conditions = CompiledExpression(conditions)
+        c = {"conditions": conditions, "constraint": constraint}
+        self._constraints.append(c)
+        keys = set()
+        for v in conditions.variables | constraint.variables:
+            self._constraints_by_variable.setdefault(v, []).append(c)
+            keys.update(self._cache_keys_by_variable.get(v, []))
+        # the new constraint is the last one, the lists stay in order
+        for key in keys:
+            self._constraints_cache[key].append(c)
+
+    def _index_constraints(self, action: Action):
+        for e in action.effects or []:
+            key = frozenset(e.keys())
+            if key not in self._constraints_cache:
+                self._constraints_cache[key] = self._find_constraints(key)
+                for v in key:
+                    self._cache_keys_by_variable.setdefault(v, []).append(key)
+
+    def _find_constraints(self, variable_names: FrozenSet[str]) -> List[Dict]:
+        constraint_ids = {id(c) for v in variable_names for c in self._constraints_by_variable.get(v, [])}
+        return [c for c in self._constraints if id(c) in constraint_ids]
+
+    def constraints_on(self, variable_names: Iterable[str]) -> List[Dict]:
+        """Returns the constraints that depend on (at least one of) the state
+        variables `variable_names`, i.e. the only ones that need to be checked
+        again when these variables change.
+
+        The constraints on the variables changed by each effect of the actions
+        are computed when the actions and the constraints are added, so this
+        function never modifies the domain."""
+        key = frozenset(variable_names)
+        constraints = self._constraints_cache.get(key, None)
+        if constraints is None:
+            constraints = self._find_constraints(key)
+        return constraints
+
     def get_initial_state(self) -> "State":
         """This function provides the initial state, built by the initial_values
            of all the state variables."""
@@ -42,13 +104,107 @@ class Domain:
             }
         )
 
-    def load_from_dict(self, definition):
+    def load_from_dict(self, definition, compiled_path: Optional[str] = None):
+        """Loads the actions and the variables from a definition (e.g., loaded
+        from a YAML file).
+
+        If `compiled_path` is given, the domain is taken from the compiled
+        artifact stored there, as long as it has been built from the very same
+        definition; otherwise the definition is parsed as usual and the artifact
+        is (re-)written, so that the next load is fast.
+        """
         if "domain" in definition:
             definition = definition["domain"]
+        source_hash = None
+        if compiled_path is not None:
+            source_hash = definition_hash(definition)
+            compiled = Domain.load_compiled(compiled_path, source_hash)
+            if compiled is not None:
+                if not self._actions and not self._variables and not self._constraints:
+                    # the indexes stored in the artifact are used as they are
+                    self.__dict__.update(compiled.__dict__)
+                    return
+                for action in compiled.actions.values():
+                    self.add_action(action)
+                for variable in compiled.variables.values():
+                    self.add_variable(variable)
+                for c in compiled.constraints:
+                    self.add_constraint(c["constraint"], c["conditions"])
+                return
         for action_name, action_definition in definition["actions"].items():
             yaction = Action(name=action_name, **action_definition)
             self.add_action(yaction)
         for variable_name, variable_definition in definition["variables"].items():
             yvariable = StateVariable(name=variable_name, **variable_definition)
             self.add_variable(yvariable)
+        for constraint_definition in definition.get("constraints", []):
+            self.add_constraint(**constraint_definition)
+        if compiled_path is not None:
+            self.save_compiled(compiled_path, source_hash)
+
+    def to_dict(self) -> Dict:
+        """Returns the definition of this domain, in the same format accepted
+        by `load_from_dict`."""
+        return {
+            "actions": {
+                name: {"preconditions": a.preconditions, "effects": a.effects, "cost": a.cost}
+                for name, a in self._actions.items()
+            },
+            "variables": {
+                name: {
+                    "values": v.values,
+                    "initial_value": v.initial_value,
+                    "possible_values": v.possible_values,
+                    "type": v.var_type,
+                }
+                for name, v in self._variables.items()
+            },
+            "constraints": [
+                {"conditions": c["conditions"].expression, "constraint": c["constraint"].expression}
+                for c in self._constraints
+            ],
+        }
+
+    def _expressions(self) -> Iterable[CompiledExpression]:
+        for action in self._actions.values():
+            if action.compiled_preconditions is not None:
+                yield action.compiled_preconditions
+        for c in self._constraints:
+            yield c["conditions"]
+            yield c["constraint"]
+
+    def save_compiled(self, path: str, source_hash: Optional[str] = None):
+        """Writes this domain, with all its expressions already parsed, to the
+        compiled artifact `path`.
+
+        The artifact starts with a small header holding the format version and
+        the `source_hash` of the definition it has been built from (by default
+        the hash of `to_dict()`), so that stale artifacts can be detected
+        without loading them entirely. The expressions are stored already
+        parsed, with the equal subtrees shared, together with their variables
+        and the indexes of the domain.
+        """
+        if source_hash is None:
+            source_hash = definition_hash(self.to_dict())
+        # the subtrees are shared in a copy, this domain is left as it is
+        domain = copy.deepcopy(self)
+        subtrees = {}
+        for expression in domain._expressions():
+            expression.compiled_ast_tree = share_subtrees(expression.compiled_ast_tree, subtrees)
+        save_artifact(path, {"format_version": COMPILED_DOMAIN_FORMAT_VERSION, "source_hash": source_hash}, domain)
+
+    @staticmethod
+    def load_compiled(path: str, source_hash: Optional[str] = None) -> Optional["Domain"]:
+        """Loads a domain from the compiled artifact `path`.
 
+        Returns None if the artifact is missing, unreadable, written with
+        another format version or, when `source_hash` is given, built from a
+        different definition (see `load_artifact`).
+        """
+        expected_header = {"format_version": COMPILED_DOMAIN_FORMAT_VERSION}
+        if source_hash is not None:
+            expected_header["source_hash"] = source_hash
+        domain = load_artifact(path, expected_header)
+        if not isinstance(domain, Domain):
+            return None
+        return domain
@@ -0,0 +1,218 @@
+import enum
+import heapq
+import itertools
+from typing import Optional
+
+from .state import State, DeltaState
+from .utils import CompiledExpression
+from .plan import Plan, PlannerOutcome, PlannerResult
+
+
+class MonitorOutcome(enum.Enum):
+    VALID = enum.auto()
+    GOAL_REACHED = enum.auto()
+    REPAIRED = enum.auto()
+    REPLANNED = enum.auto()
+    FAILURE = enum.auto()
+
+
+class PlanMonitor:
+    """Follows the execution of a plan computed by a Planner.
+
+    The executor calls `update` with every observed state; the observed state
+    is matched against the expected states stored in the plan and the rest of
+    the plan is validated by simulating the remaining actions. Only the
+    preconditions (and the goal) that read variables whose value differs
+    from the expected one are evaluated again.
+
+    When the rest of the plan is not valid anymore, the monitor first looks
+    for a cheap local repair, i.e. a short sequence of actions after which
+    a suffix of the plan is valid again, and only if it cannot
+    find one it falls back to planning from scratch with the planner.
+    """
+
+    def __init__(self, planner, planner_result: PlannerResult, repair_max_depth: int = 2, repair_max_expansions: int = 200):
+        """Constructor
+
+        Args:
+            planner (Planner): the planner that computed the plan, its domain
+                is used to validate and to repair the plan
+            planner_result (PlannerResult): the result of the planner, it must
+                contain a plan (i.e. it must not be a failure), the plan is
+                monitored with respect to its goal (so it must have one)
+            repair_max_depth (int): the maximum number of actions that the local
+                repair can add before rejoining the plan
+            repair_max_expansions (int): the maximum number of states expanded
+                by the local repair
+        """
+        if planner_result.plan is None:
+            raise ValueError("Cannot monitor a planner result without a plan")
+        if planner_result.goal is None:
+            raise ValueError("Cannot monitor a planner result without a goal")
+        self._planner = planner
+        self.repair_max_depth = repair_max_depth
+        self.repair_max_expansions = repair_max_expansions
+        self.last_planner_result = planner_result
+        self.stats = {"updates": 0, "evaluations": 0, "repairs": 0, "replans": 0}
+        self._goal_expr = CompiledExpression(planner_result.goal)
+        self._set_plan(planner_result.plan)
+
+    @property
+    def plan(self) -> Plan:
+        """The plan that is currently followed (it changes after a repair or a replan)."""
+        return self._plan
+
+    @property
+    def step(self) -> int:
+        """The index, in `plan`, of the next action to execute."""
+        return self._step
+
+    @property
+    def next_action(self) -> Optional[str]:
+        """The name of the next action to execute, None if the goal is reached."""
+        return self._plan[self._step][1]
+
+    def update(self, observed_state: "State") -> MonitorOutcome:
+        """Checks the observed state against the plan.
+
+        This function returns VALID if the rest of the plan (starting from
+        `next_action`) still reaches the goal, GOAL_REACHED if the observed
+        state satisfies the goal, REPAIRED or REPLANNED if a new plan has
+        been computed and FAILURE if the goal cannot be reached anymore.
+        """
+        self.stats["updates"] += 1
+        if self._goal_expr.eval_in_state(observed_state):
+            self._step = len(self._plan) - 1
+            return MonitorOutcome.GOAL_REACHED
+
+        # the action might have been executed or not yet
+        for j in (self._step + 1, self._step):
+            if j < len(self._plan) and self._suffix_valid(observed_state, j):
+                self._step = j
+                return MonitorOutcome.VALID
+
+        repaired_plan = self._repair(observed_state)
+        if repaired_plan is not None:
+            self.stats["repairs"] += 1
+            self._set_plan(repaired_plan)
+            return MonitorOutcome.REPAIRED
+
+        self.stats["replans"] += 1
+        planner_result = self._planner.plan(observed_state, self._goal_expr.expression)
+        self.last_planner_result = planner_result
+        if planner_result.outcome in [PlannerOutcome.SUCCESS, PlannerOutcome.ALREADY_AT_GOAL]:
+            self._set_plan(planner_result.plan)
+            return MonitorOutcome.REPLANNED
+        return MonitorOutcome.FAILURE
+
+    def _set_plan(self, plan):
+        self._plan = plan
+        self._step = 0
+        self._effects = []
+        for k in range(len(plan) - 1):
+            state, action_name = plan[k]
+            next_state = plan[k + 1][0]
+            action = self._planner.domain.action(action_name)
+            for e in action.effects:
+                if {**state, **e} == next_state:
+                    break
+            else:
+                e = {v: val for v, val in next_state.items() if state.get(v, KeyError) != val}
+            self._effects.append(e)
+        self._suffix_costs = [0] * len(plan)
+        for k in range(len(plan) - 2, -1, -1):
+            self._suffix_costs[k] = self._suffix_costs[k + 1] + self._planner.domain.action(plan[k][1]).cost
+
+    def _suffix_valid(self, observed_state, j) -> bool:
+        """Returns True if the plan, starting from step `j`, reaches the goal
+        when executed in the observed state."""
+        expected_state = self._plan[j][0]
+        diff = {
+            v for v in observed_state.keys() | expected_state.keys()
+            if observed_state.get(v, KeyError) != expected_state.get(v, KeyError)
+        }
+        state = None
+        for k in range(j, len(self._plan) - 1):
+            if not diff:
+                # from here on, the simulated state is the expected one
+                return True
+            action = self._planner.domain.action(self._plan[k][1])
+            if state is None:
+                state = State(observed_state)
+            preconditions = action.compiled_preconditions
+            if preconditions is not None and not diff.isdisjoint(preconditions.variables):
+                self.stats["evaluations"] += 1
+                if not preconditions.eval_in_state(state):
+                    return False
+            state.update(self._effects[k])
+            # the constraints that only read variables with the expected
+            # values held when the plan was found
+            constraints = [
+                c for c in self._planner.domain.constraints_on(self._effects[k].keys())
+                if not diff.isdisjoint(c["conditions"].variables | c["constraint"].variables)
+            ]
+            if constraints:
+                self.stats["evaluations"] += 1
+                if not state.satisfies_constraints(constraints):
+                    return False
+            diff.difference_update(self._effects[k].keys())
+        if not diff:
+            return True
+        if diff.isdisjoint(self._goal_expr.variables):
+            return True
+        self.stats["evaluations"] += 1
+        return bool(self._goal_expr.eval_in_state(state if state is not None else observed_state))
+
+    def _repair(self, observed_state) -> Optional[Plan]:
+        """Looks for a short sequence of actions that brings the observed
+        state to a state from which the rest of the plan (starting from some
+        step) is valid again, returns the repaired plan or None."""
+        counter = itertools.count()
+        initial_state = DeltaState(observed_state)
+        open_pq = [(0, next(counter), initial_state, 0)]
+        parents = {initial_state: None}
+        costs = {initial_state: 0}
+        best = None  # (total cost, state, index in plan)
+        expansions = 0
+        while open_pq and expansions < self.repair_max_expansions:
+            cost, _, state, depth = heapq.heappop(open_pq)
+            if best is not None and cost >= best[0]:
+                break
+            if cost > costs[state]:
+                continue  # already reached with a lower cost
+            # rejoin the plan at the step with the cheapest valid suffix
+            rejoined = False
+            for j in range(self._step, len(self._plan)):
+                total_cost = cost + self._suffix_costs[j]
+                if best is not None and total_cost >= best[0]:
+                    continue
+                if self._suffix_valid(state, j):
+                    best = (total_cost, state, j)
+                    rejoined = True
+            if rejoined:
+                continue
+            if depth >= self.repair_max_depth:
+                continue
+            expansions += 1
+            for action in self._planner.domain.actions.values():
+                if not action.applicable(state):
+                    continue
+                for effects, new_state in zip(action.effects, action.possible_outcomes(state)):
+                    if not new_state.satisfies_constraints(self._planner.domain.constraints_on(effects.keys())):
+                        continue
+                    new_cost = cost + action.cost
+                    if new_state in costs and costs[new_state] <= new_cost:
+                        continue
+                    costs[new_state] = new_cost
+                    parents[new_state] = (state, action.name)
+                    heapq.heappush(open_pq, (new_cost, next(counter), new_state, depth + 1))
+        if best is None:
+            return None
+
+        _, state, j = best
+        prefix = []
+        while parents[state] is not None:
+            state, action_name = parents[state]
+            prefix.append((state.to_state(), action_name))
+        prefix.reverse()
+        return Plan(prefix + list(self._plan[j:]))
@@ -0,0 +1,412 @@
+import array
+import ast
+import collections
+import heapq
+import math
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from simpleeval import SimpleEval
+
+from .utils import CompiledExpression, definition_hash, load_artifact, save_artifact
+
+
+# bump this every time the content of the pattern database files changes
+PDB_FORMAT_VERSION = 2
+
+_UNKNOWN = object()
+
+
+def _partial_eval(evaluator: SimpleEval, node, assignment: Dict):
+    """Evaluates an expression when only some of the variables are known.
+
+    The result is _UNKNOWN if it depends on the variables that are not in
+    `assignment`. Only the boolean operators and the conditional expressions
+    are evaluated in a three-valued way, any other (sub-)expression is either
+    fully known or unknown.
+    """
+    if isinstance(node, ast.BoolOp):
+        is_and = isinstance(node.op, ast.And)
+        unknown = False
+        for operand in node.values:
+            value = _partial_eval(evaluator, operand, assignment)
+            if value is _UNKNOWN:
+                unknown = True
+            elif is_and and not value:
+                return False
+            elif not is_and and value:
+                return True
+        return _UNKNOWN if unknown else is_and
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        value = _partial_eval(evaluator, node.operand, assignment)
+        return _UNKNOWN if value is _UNKNOWN else not value
+    if isinstance(node, ast.IfExp):
+        test = _partial_eval(evaluator, node.test, assignment)
+        if test is not _UNKNOWN:
+            return _partial_eval(evaluator, node.body if test else node.orelse, assignment)
+        body = _partial_eval(evaluator, node.body, assignment)
+        orelse = _partial_eval(evaluator, node.orelse, assignment)
+        return body if body is not _UNKNOWN and orelse is not _UNKNOWN and body == orelse else _UNKNOWN
+    if any(isinstance(n, ast.Name) and n.id not in assignment for n in ast.walk(node)):
+        return _UNKNOWN
+    evaluator.names = assignment
+    try:
+        return evaluator._eval(node)
+    except Exception:
+        return _UNKNOWN
+
+
+class _AbstractCondition:
+    """A condition (precondition or goal) evaluated over the abstract states
+    of a pattern: it is false only if it is false for every value of the
+    variables that are not in the pattern."""
+
+    def __init__(self, expression: Optional[CompiledExpression], pattern: Sequence[str]):
+        self._expression = expression
+        self._evaluator = None
+        self.variables = ()
+        if expression is not None:
+            self._evaluator = SimpleEval(operators=expression.operators, functions=expression.functions)
+            self.variables = tuple(v for v in pattern if v in expression.variables)
+        self._cache = {}
+
+    def maybe_true(self, assignment: Dict) -> bool:
+        if self._expression is None:
+            return True
+        key = tuple(assignment[v] for v in self.variables)
+        result = self._cache.get(key, None)
+        if result is None:
+            value = _partial_eval(
+                self._evaluator, self._expression.compiled_ast_tree, {v: assignment[v] for v in self.variables}
+            )
+            result = value is _UNKNOWN or bool(value)
+            self._cache[key] = result
+        return result
+
+
+class PatternDatabase:
+    """The cost-to-go table of the projection of a domain onto a subset of
+    its state variables (the pattern).
+
+    The abstract states (assignments of the pattern variables) are ranked
+    with a perfect hash, i.e. the mixed radix number of the indexes of the
+    values of the variables, and the table is an array of floats indexed by
+    rank (math.inf for the abstract states from which the goal cannot be
+    reached).
+    """
+
+    def __init__(self, pattern: Sequence[str], values: Sequence[Sequence], table: array.array):
+        self.pattern = tuple(pattern)
+        self.values = [list(v) for v in values]
+        self.table = table
+        self._indexes = [{value: i for i, value in enumerate(v)} for v in self.values]
+        self._multipliers = []
+        multiplier = 1
+        for v in self.values:
+            self._multipliers.append(multiplier)
+            multiplier *= len(v)
+
+    def __len__(self):
+        return len(self.table)
+
+    def rank(self, state) -> Optional[int]:
+        """The index in the table of the projection of the state, None if some
+        variable of the pattern is missing or has a value not in the table."""
+        index = 0
+        for v, indexes, multiplier in zip(self.pattern, self._indexes, self._multipliers):
+            i = indexes.get(state.get(v, None), None)
+            if i is None:
+                return None
+            index += i * multiplier
+        return index
+
+    def unrank(self, index: int) -> Dict:
+        assignment = {}
+        for v, values in zip(self.pattern, self.values):
+            index, i = divmod(index, len(values))
+            assignment[v] = values[i]
+        return assignment
+
+    def __call__(self, state) -> float:
+        index = self.rank(state)
+        return 0 if index is None else self.table[index]
+
+    @staticmethod
+    def build(domain, goal: Union[str, CompiledExpression], pattern: Sequence[str], variable_values: Dict[str, List]) -> "PatternDatabase":
+        """Builds the pattern database of `pattern`, with an exhaustive
+        backward search (Dijkstra) in the abstract state space.
+
+        The abstraction is conservative: an abstract transition exists if the
+        preconditions of the action might hold for some value of the other
+        variables, an abstract state is a goal if the goal might hold. The
+        constraints of the domain are ignored (they can only make the real
+        costs higher). Therefore the table is an admissible and consistent
+        heuristic.
+        """
+        if not isinstance(goal, CompiledExpression):
+            goal = CompiledExpression(goal)
+        pdb = PatternDatabase(pattern, [variable_values[v] for v in pattern], array.array("d"))
+        size = 1
+        for values in pdb.values:
+            size *= len(values)
+
+        # only the actions changing some variable of the pattern matter,
+        # the other ones are self loops in the abstract state space
+        pattern_set = set(pdb.pattern)
+        abstract_actions = []
+        for action in domain.actions.values():
+            effects = []
+            for e in action.effects or []:
+                projected = {v: value for v, value in e.items() if v in pattern_set}
+                if projected and projected not in effects:
+                    effects.append(projected)
+            if effects:
+                abstract_actions.append(
+                    (_AbstractCondition(action.compiled_preconditions, pdb.pattern), effects, action.cost)
+                )
+
+        predecessors = collections.defaultdict(list)
+        for index in range(size):
+            assignment = pdb.unrank(index)
+            for preconditions, effects, cost in abstract_actions:
+                if not preconditions.maybe_true(assignment):
+                    continue
+                for e in effects:
+                    new_index = pdb.rank({**assignment, **e})
+                    if new_index != index:
+                        predecessors[new_index].append((index, cost))
+
+        goal_condition = _AbstractCondition(goal, pdb.pattern)
+        table = array.array("d", [math.inf]) * size
+        open_pq = []
+        for index in range(size):
+            if goal_condition.maybe_true(pdb.unrank(index)):
+                table[index] = 0
+                open_pq.append((0, index))
+        heapq.heapify(open_pq)
+        while open_pq:
+            cost, index = heapq.heappop(open_pq)
+            if cost > table[index]:
+                continue
+            for prev_index, action_cost in predecessors.get(index, []):
+                new_cost = cost + action_cost
+                if new_cost < table[prev_index]:
+                    table[prev_index] = new_cost
+                    heapq.heappush(open_pq, (new_cost, prev_index))
+        pdb.table = table
+        return pdb
+
+
+def variable_values(domain, initial_state=None) -> Dict[str, List]:
+    """Collects the possible values of the state variables of a domain: the
+    declared ones, the initial values and the values assigned by the effects
+    of the actions (plus the ones in `initial_state`, if given)."""
+    values = collections.defaultdict(dict)  # dicts are used as ordered sets
+    for name, v in domain.variables.items():
+        for value in list(v.values or []) + list(v.possible_values or []):
+            values[name][value] = None
+        values[name][v.initial_value if v.initial_value is not None else "UNK"] = None
+    for action in domain.actions.values():
+        for e in action.effects or []:
+            for name, value in e.items():
+                values[name][value] = None
+    if initial_state is not None:
+        for name, value in initial_state.items():
+            values[name][value] = None
+    return {name: list(v.keys()) for name, v in values.items()}
+
+
+def select_patterns(domain, goal: Union[str, CompiledExpression], values: Dict[str, List], max_size: int = 10000) -> List[Tuple[str, ...]]:
+    """Chooses disjoint patterns for a goal: one pattern for each variable of
+    the goal (not already in another pattern), extended with the variables it
+    depends on the most in the causal graph of the domain (i.e., the ones read
+    by the preconditions or written together with it by the actions), as long
+    as the abstract state space has at most `max_size` states."""
+    if not isinstance(goal, CompiledExpression):
+        goal = CompiledExpression(goal)
+    dependencies = collections.defaultdict(collections.Counter)
+    for action in domain.actions.values():
+        written = {v for e in action.effects or [] for v in e if v in values}
+        read = set()
+        if action.compiled_preconditions is not None:
+            read = {v for v in action.compiled_preconditions.variables if v in values}
+        for w in written:
+            for r in read | written:
+                if r != w:
+                    dependencies[w][r] += 1
+
+    patterns = []
+    used = set()
+    for g in sorted(v for v in goal.variables if v in values):
+        if g in used:
+            continue
+        pattern = [g]
+        size = len(values[g])
+        while True:
+            candidates = collections.Counter()
+            for v in pattern:
+                for r, n in dependencies[v].items():
+                    if r not in pattern and r not in used:
+                        candidates[r] += n
+            for r, _ in sorted(candidates.items(), key=lambda x: (-x[1], x[0])):
+                if size * len(values[r]) <= max_size:
+                    pattern.append(r)
+                    size *= len(values[r])
+                    break
+            else:
+                break
+        used.update(pattern)
+        patterns.append(tuple(pattern))
+    return patterns
+
+
+def _additive(domain, patterns) -> bool:
+    """Returns True if the pattern databases can be summed, i.e. if the
+    patterns are disjoint and no action changes variables of two patterns."""
+    pattern_of = {}
+    for i, pattern in enumerate(patterns):
+        for v in pattern:
+            if v in pattern_of:
+                return False
+            pattern_of[v] = i
+    for action in domain.actions.values():
+        touched = {pattern_of[v] for e in action.effects or [] for v in e if v in pattern_of}
+        if len(touched) > 1:
+            return False
+    return True
+
+
+def _build_options(patterns=None, initial_state=None, max_size: int = 10000, combine: str = None) -> Dict:
+    """The arguments of PatternDatabaseHeuristic.build, as stored in the
+    header of the files (only the hash of the initial state is stored)."""
+    return {
+        "patterns": None if patterns is None else [list(pattern) for pattern in patterns],
+        "initial_state": None if initial_state is None else definition_hash(dict(initial_state)),
+        "max_size": max_size,
+        "combine": combine,
+    }
+
+
+class PatternDatabaseHeuristic:
+    """An admissible and consistent heuristic for the Planner (to be passed
+    as `heuristic` to `Planner.plan`), made of the pattern databases of a
+    domain for a given goal, combined either by sum ("add", only when the
+    patterns are additive) or by maximum ("max").
+
+    Building the pattern databases can be expensive, but they can be saved
+    to a file and loaded back as long as the domain, the goal and the
+    arguments of `build` do not change (see `load_or_build`).
+    """
+
+    def __init__(self, pdbs: List[PatternDatabase], combine: str = "max", goal: str = None, domain_hash: str = None, build_options: Dict = None):
+        if combine not in ["add", "max"]:
+            raise ValueError(f"Unknown combination '{combine}'")
+        self.pdbs = pdbs
+        self.combine = combine
+        self.goal = goal
+        self.domain_hash = domain_hash
+        self.build_options = build_options
+
+    def __call__(self, state) -> float:
+        if self.combine == "add":
+            h = 0
+            for pdb in self.pdbs:
+                h += pdb(state)
+            return h
+        h = 0
+        for pdb in self.pdbs:
+            pdb_h = pdb(state)
+            if pdb_h > h:
+                h = pdb_h
+        return h
+
+    @staticmethod
+    def build(
+        domain,
+        goal: str,
+        patterns: List[Sequence[str]] = None,
+        initial_state=None,
+        max_size: int = 10000,
+        combine: str = None,
+    ) -> "PatternDatabaseHeuristic":
+        """Builds the pattern databases of `domain` for `goal`.
+
+        Args:
+            domain (Domain): the domain
+            goal (str): the goal expression
+            patterns (list): the patterns (lists of variable names), chosen
+                automatically from the goal and the causal graph if not given
+            initial_state (State): a state whose values are added to the
+                ones declared in the domain (states with values unknown to a
+                pattern database get 0 from it)
+            max_size (int): the maximum number of abstract states of each
+                pattern chosen automatically
+            combine (str): "add" or "max", by default "add" if the patterns
+                are additive, "max" otherwise
+        """
+        goal = goal.replace("\n", " ")
+        values = variable_values(domain, initial_state)
+        build_options = _build_options(patterns, initial_state, max_size, combine)
+        if patterns is None:
+            patterns = select_patterns(domain, goal, values, max_size)
+        additive = _additive(domain, patterns)
+        if combine is None:
+            combine = "add" if additive else "max"
+        elif combine == "add" and not additive:
+            raise ValueError("The patterns are not additive, they cannot be combined with 'add'")
+        goal_expr = CompiledExpression(goal)
+        pdbs = [PatternDatabase.build(domain, goal_expr, pattern, values) for pattern in patterns]
+        return PatternDatabaseHeuristic(pdbs, combine, goal, definition_hash(domain.to_dict()), build_options)
+
+    def save(self, path: str):
+        """Writes the pattern databases to `path`, with a header holding the
+        format version, the hash of the domain, the goal and the arguments
+        of `build`."""
+        header = {
+            "format_version": PDB_FORMAT_VERSION,
+            "domain_hash": self.domain_hash,
+            "goal": self.goal,
+            "build_options": self.build_options,
+        }
+        content = {
+            "combine": self.combine,
+            "pdbs": [(pdb.pattern, pdb.values, pdb.table) for pdb in self.pdbs],
+        }
+        save_artifact(path, header, (header, content))
+
+    @staticmethod
+    def load(path: str, domain=None, goal: str = None, **build_options) -> Optional["PatternDatabaseHeuristic"]:
+        """Loads the pattern databases from `path`.
+
+        Returns None if the file is missing, unreadable, written with another
+        format version or, when `domain` and `goal` are given, built for a
+        different domain or goal (see `load_artifact`). When `domain` is
+        given, the file must also have been built with the same arguments
+        (`patterns`, `initial_state`, `max_size` and `combine`, with the same
+        defaults of `build`) as `build_options`.
+        """
+        expected_header = {"format_version": PDB_FORMAT_VERSION}
+        if domain is not None:
+            expected_header["domain_hash"] = definition_hash(domain.to_dict())
+            expected_header["build_options"] = _build_options(**build_options)
+        if goal is not None:
+            expected_header["goal"] = goal.replace("\n", " ")
+        artifact = load_artifact(path, expected_header)
+        if artifact is None:
+            return None
+        header, content = artifact
+        pdbs = [PatternDatabase(pattern, values, table) for pattern, values, table in content["pdbs"]]
+        return PatternDatabaseHeuristic(
+            pdbs, content["combine"], header["goal"], header["domain_hash"], header["build_options"]
+        )
+
+    @staticmethod
+    def load_or_build(path: str, domain, goal: str, **kwargs) -> "PatternDatabaseHeuristic":
+        """Loads the pattern databases of `domain` for `goal` from `path`, or
+        builds them (see `build` for the other arguments) and saves them there
+        if the file is missing or stale, i.e. built for another domain, goal
+        or with other arguments."""
+        heuristic = PatternDatabaseHeuristic.load(path, domain, goal, **kwargs)
+        if heuristic is None:
+            heuristic = PatternDatabaseHeuristic.build(domain, goal, **kwargs)
+            heuristic.save(path)
+        return heuristic
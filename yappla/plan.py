@@ -8,6 +8,7 @@ class PlannerOutcome(enum.Enum):
     SUCCESS = enum.auto()
     ALREADY_AT_GOAL = enum.auto()
     FAILURE = enum.auto()
+    TIMEOUT = enum.auto()
 
 
 def _diff_dicts(a, b, missing=KeyError):
@@ -21,6 +22,7 @@ class PlannerResult:
     def __init__(self, planner):
         self.outcome = PlannerOutcome.INVALID
         self.plan = None
+        self.goal = None
         self.stats = {}
         self._planner = planner
 
@@ -40,6 +42,8 @@ class PlannerResult:
                 prev_state = p[0]
         elif self.outcome == PlannerOutcome.FAILURE:
             my_repr.append(f"{bc.RED}PLANNER FAILED{bc.ENDC}")
+        elif self.outcome == PlannerOutcome.TIMEOUT:
+            my_repr.append(f"{bc.RED}PLANNER TIMED OUT{bc.ENDC}")
         elif self.outcome == PlannerOutcome.ALREADY_AT_GOAL:
             my_repr.append(f"{bc.GREEN}CURRENT STATE SATISFIES GOAL{bc.ENDC}")
             my_repr.append(f"{self.plan[0][0].pretty_str()}")
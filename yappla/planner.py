@@ -1,19 +1,45 @@
-import time
-import copy
+import asyncio
+import concurrent.futures
+import functools
 import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Union
 
-from .state import State
+from .state import State, DeltaState
 from .utils import CompiledExpression, bc, PriorityQueue
 from .plan import Plan, PlannerOutcome, PlannerResult
+from .trace import SearchTraceWriter
 
 
 class Planner:
+    """Plans in a domain, i.e. looks for the cheapest sequence of actions
+    leading from a state to a goal.
+
+    Thread-safety: the planner only holds its configuration (domain, default
+    goal, limits, logger); everything related to a single query lives in the
+    query itself. While planning, the planner and the domain are not
+    modified: the variables of the expressions and the constraints to check
+    after each effect are computed when the domain is built. The only shared
+    data written by a query are the thread-local evaluators of the
+    expressions and the cache of the Zobrist keys of the assignments (see
+    state.py), whose entries are only added and never change, so that
+    concurrent queries can fill it safely. The same Planner (and the same
+    Domain) can therefore be used by many threads at once, as long as the
+    configuration is not changed while planning (e.g., pass the goal to
+    `plan` instead of using `set_goal` from different threads).
+    """
+
     class FakePrintLogger:
         def info(self, message):
             print("[YAPPLA] " + message)
 
     def __init__(self, logger=None):
         self.max_iterations = 10000
+        # the states generated during the search are materialized (i.e., fully
+        # copied) only once every this many applied actions
+        self.state_materialization_depth = 32
         self._cur_goal = None
         self._domain = None
         self.max_verbosity_level = 0  # 0 no messages, 1 only a few, 2 everything
@@ -33,62 +59,282 @@ class Planner:
     def domain(self):
         return self._domain
 
-    def plan(self, initial_state: "State", goal=None):
+    def plan(
+        self,
+        initial_state: "State",
+        goal=None,
+        timeout: float = None,
+        trace: SearchTraceWriter = None,
+        heuristic: Callable[["State"], float] = None,
+    ):
+        """Plans from `initial_state` to `goal` (or to the goal previously set
+        with `set_goal`), giving up after `timeout` seconds if given.
+
+        If a `trace` is given, all the events of the search (expansions,
+        generated states, duplicates, cost updates and pruned states) are
+        written to it.
+
+        If a `heuristic` is given, i.e. a function returning an estimate of the
+        cost from a state to the goal (math.inf if the goal cannot be reached
+        from there), the search is an A* instead of a uniform-cost search. The
+        heuristic has to be admissible and consistent for the plan to be
+        optimal (e.g., PatternDatabaseHeuristic). A heuristic with a `goal`
+        attribute different from the goal of the query raises a ValueError.
+        """
+        search = self._search(initial_state, goal, timeout, trace, heuristic)
+        while True:
+            try:
+                next(search)
+            except StopIteration as stop:
+                return stop.value
+
+    def plan_multi(
+        self,
+        initial_state: "State",
+        goals: Union[List[str], Dict[str, str]],
+        cost_bound: float = None,
+        timeout: float = None,
+        trace: SearchTraceWriter = None,
+    ) -> Union[List[PlannerResult], Dict[str, PlannerResult]]:
+        """Plans from `initial_state` to each of the `goals` with a single
+        uniform-cost search, instead of one search per goal.
+
+        Every expanded state is checked against all the goals not reached
+        yet; the first state satisfying a goal gives its (optimal) plan. The
+        search stops when all the goals are reached or when the cost of the
+        expanded states exceeds `cost_bound`, if given; the goals not reached
+        get a failure.
+
+        The goals can be a list or a dict (e.g., candidate name -> goal), the
+        planner results are returned in the same form; all of them share the
+        stats of the search, plus the "cost" of their plan.
+        """
+        goal_strs = list(goals.values()) if isinstance(goals, dict) else list(goals)
+        goal_strs = [g.replace("\n", " ") for g in goal_strs]
+        search = self._sweep(initial_state, goal_strs, timeout, trace, cost_bound)
+        while True:
+            try:
+                next(search)
+            except StopIteration as stop:
+                planner_results = stop.value
+                break
+        if isinstance(goals, dict):
+            return dict(zip(goals.keys(), planner_results))
+        return planner_results
+
+    async def plan_async(
+        self,
+        initial_state: "State",
+        goal=None,
+        timeout: float = None,
+        trace: SearchTraceWriter = None,
+        heuristic: Callable[["State"], float] = None,
+        yield_every: int = 100,
+        yield_interval: float = 0.005,
+        executor=None,
+        progress_callback=None,
+    ):
+        """Same as `plan`, but it can be awaited without blocking the event loop.
+
+        The search runs in the event loop thread and gives control back to the
+        loop every `yield_every` expansions or every `yield_interval` seconds,
+        whichever comes first; cancelling the task stops the search.
+
+        If an `executor` is given, the search runs there instead: with a thread
+        pool, cancelling the task stops the search at the next expansion; with
+        a process pool, the search cannot be interrupted and its result is
+        simply discarded.
+
+        The `timeout` (in seconds), the `trace` and the `heuristic` are the same
+        as for `plan`.
+
+        If a `progress_callback` is given, it is called (in the event loop
+        thread) with a dict containing the number of "iterations", the "cost"
+        of the last expanded state (i.e., the best f-value) and the size of the
+        "open" queue.
+
+        With a process pool, neither the `trace` nor the `progress_callback` are
+        supported (ValueError).
+        """
+        loop = asyncio.get_running_loop()
+        if executor is not None:
+            if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+                if trace is not None or progress_callback is not None:
+                    raise ValueError("the trace and the progress callback are not supported with a process pool")
+                return await loop.run_in_executor(executor, functools.partial(self.plan, initial_state, goal, timeout, None, heuristic))
+            cancelled = threading.Event()
+
+            def notify_progress(progress):
+                loop.call_soon_threadsafe(progress_callback, progress)
+
+            try:
+                return await loop.run_in_executor(
+                    executor,
+                    functools.partial(
+                        self._plan_cancellable,
+                        initial_state,
+                        goal,
+                        timeout,
+                        trace,
+                        heuristic,
+                        cancelled,
+                        yield_every,
+                        yield_interval,
+                        notify_progress if progress_callback else None,
+                    ),
+                )
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        search = self._search(initial_state, goal, timeout, trace, heuristic)
+        try:
+            last_yield_time = time.monotonic()
+            while True:
+                try:
+                    iterations, cost, open_size = next(search)
+                except StopIteration as stop:
+                    return stop.value
+                if iterations % yield_every == 0 or time.monotonic() - last_yield_time >= yield_interval:
+                    if progress_callback:
+                        progress_callback({"iterations": iterations, "cost": cost, "open": open_size})
+                    await asyncio.sleep(0)
+                    last_yield_time = time.monotonic()
+        finally:
+            search.close()
+
+    def _plan_cancellable(self, initial_state, goal, timeout, trace, heuristic, cancelled, progress_every, progress_interval, progress_callback):
+        search = self._search(initial_state, goal, timeout, trace, heuristic)
+        last_progress_time = time.monotonic()
+        while not cancelled.is_set():
+            try:
+                iterations, cost, open_size = next(search)
+            except StopIteration as stop:
+                return stop.value
+            if progress_callback and (
+                iterations % progress_every == 0 or time.monotonic() - last_progress_time >= progress_interval
+            ):
+                progress_callback({"iterations": iterations, "cost": cost, "open": open_size})
+                last_progress_time = time.monotonic()
+        search.close()
+        return None
+
+    def _search(self, initial_state: "State", goal=None, timeout: float = None, trace: SearchTraceWriter = None, heuristic=None):
+        """The actual search, as a generator that yields (iterations, f-value of
+        the expanded state, size of the open queue) after every expansion and
+        returns the PlannerResult."""
         if goal:
-            self.set_goal(goal)
+            cur_goal_str = goal.replace("\n", " ")
+        else:
+            cur_goal_str = self._compute_cur_goal(initial_state)
+        # the dead ends of a heuristic built for another goal are not dead ends
+        heuristic_goal = getattr(heuristic, "goal", None)
+        if heuristic_goal is not None and heuristic_goal.replace("\n", " ") != cur_goal_str:
+            raise ValueError(f"The heuristic has been built for the goal '{heuristic_goal}', not for '{cur_goal_str}'")
+        planner_results = yield from self._sweep(initial_state, [cur_goal_str], timeout, trace, heuristic=heuristic)
+        return planner_results[0]
+
+    def _sweep(
+        self,
+        initial_state: "State",
+        goal_strs: List[str],
+        timeout: float = None,
+        trace: SearchTraceWriter = None,
+        cost_bound: float = None,
+        heuristic=None,
+    ):
+        """Uniform-cost search from the initial state, until every goal is
+        reached (or the search space is exhausted, or one of the limits is
+        hit), same as `_search` but it returns a PlannerResult for each goal.
+        With a heuristic (only meaningful with a single goal), it is an A*.
+
+        All the state of the query (open queue, visited states, results) is
+        local to this generator (see the Planner docstring about the data
+        shared by concurrent queries).
+        """
         initial_time = time.thread_time()
-        initial_state = State(copy.deepcopy(initial_state))
-        cur_goal_str = self._compute_cur_goal(initial_state)
-        cur_goal_expr = CompiledExpression(cur_goal_str)
+        initial_state = DeltaState(initial_state, max_depth=self.state_materialization_depth)
+        goal_exprs = [CompiledExpression(g) for g in goal_strs]
         self.log(1, "")
         self.log(1, f"Planning from state: [{initial_state.hash()}]\n{initial_state.pretty_str()}")
-        self.log(1, f"To goal: {cur_goal_str}")
-        open_pq = PriorityQueue()
-        open_pq.push(initial_state, 0)  # state descriptions are taken from here
-        to_reach = [
-            (None, None, initial_state)
-        ]  # contains tuples (prev_state, action, new_state), to_reach also needs full states to reconstruct the plan
-        visited = []
-        planner_result = PlannerResult(self)
+        for cur_goal_str in goal_strs:
+            self.log(1, f"To goal: {cur_goal_str}")
+        if trace is not None:
+            trace.begin(goal_strs[0] if len(goal_strs) == 1 else goal_strs)
+            trace.record(trace.GENERATE, hash(initial_state))
+        open_pq = PriorityQueue()  # ordered by f = g + h
+        g_costs = {initial_state: 0}
+        h_values = {}
+        dead_ends = set()
+        if heuristic is None:
+            open_pq.push(initial_state, 0)  # state descriptions are taken from here
+        else:
+            h_values[initial_state] = heuristic(initial_state)
+            if h_values[initial_state] < math.inf:
+                open_pq.push(initial_state, h_values[initial_state])
+        to_reach = {
+            initial_state: (None, None)
+        }  # maps every new_state to (prev_state, action), to_reach also needs full states to reconstruct the plan
+        visited = set()
+        planner_results = [PlannerResult(self) for _ in goal_strs]
+        for planner_result, cur_goal_str in zip(planner_results, goal_strs):
+            planner_result.goal = cur_goal_str
+        unreached_goals = list(range(len(goal_strs)))
         planning_iterations = 0
+        pruned_states = 0
+        dead_end_states = 0
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        timed_out = False
         while planning_iterations < self.max_iterations:
+            if deadline is not None and time.monotonic() > deadline:
+                timed_out = True
+                break
             # choose the state we expand from
             if open_pq.empty():
                 break
-            state, cur_state_cost = open_pq.pop()
-            visited.append(state)
+            state, cur_state_f = open_pq.pop()
+            cur_state_cost = g_costs[state]
+            if cost_bound is not None and cur_state_cost > cost_bound:
+                break
+            visited.add(state)
+            if trace is not None:
+                trace.record(trace.EXPAND, hash(state), g=cur_state_cost, h=cur_state_f - cur_state_cost)
             planning_iterations += 1
             if self.max_verbosity_level >= 2:
                 self.log(
-                    2, f"(O) [{state.hash()}] cost={cur_state_cost}\n{state.pretty_str()}"
+                    2, f"(O) [{state.hash()}] cost={cur_state_cost} f={cur_state_f}\n{state.pretty_str()}"
                 )
             elif self.max_verbosity_level == 1:
                 print(".", end="")
 
-            # let's decide if we reached the current goal
-            goal_reached = cur_goal_expr.eval_in_state(state)
-
-            # if we reached the goal, we compute the plan and exit the planning loop
-            if goal_reached:
+            # let's decide if we reached some of the goals, the first time
+            # a goal is reached the plan is optimal, since states are
+            # expanded in order of cost (of f-value, with a consistent heuristic)
+            for i in list(unreached_goals):
+                if not goal_exprs[i].eval_in_state(state):
+                    continue
                 if self.max_verbosity_level == 1:
                     self.log(1, f"[{planning_iterations}]")
                 self.log(
-                    1, f"{bc.BOLD}{bc.GREEN}=== FOUND A PLAN TO GOAL ==={bc.ENDC}"
+                    1, f"{bc.BOLD}{bc.GREEN}=== FOUND A PLAN TO GOAL ==={bc.ENDC} {goal_strs[i]}"
                 )
 
                 plan = Plan()
                 # compute the plan by starting from the goal backward to the initial state
-                plan.append((state, None))  # this is the (goal state, no action)
-                while state:
-                    for ss in to_reach:
-                        if ss[2] == state:
-                            if ss[0]:
-                                # (current state, action to perform)
-                                plan.append((ss[0], ss[1]))
-                            state = ss[0]
-                            break  # I expect only one matching in to_reach
+                plan.append((state.to_state(), None))  # this is the (goal state, no action)
+                prev_state, action_name = to_reach[state]
+                while prev_state is not None:
+                    # (current state, action to perform)
+                    plan.append((prev_state.to_state(), action_name))
+                    prev_state, action_name = to_reach[prev_state]
                 plan.reverse()
-                planner_result.plan = plan
+                planner_results[i].plan = plan
+                planner_results[i].stats["cost"] = cur_state_cost
+                planner_results[i].stats["goal_iterations"] = planning_iterations
+                unreached_goals.remove(i)
+
+            # if we reached all the goals, we exit the planning loop
+            if not unreached_goals:
                 break
 
             # expand the state extracted from the priority queue
@@ -96,49 +342,89 @@ class Planner:
                 applicable = action.applicable(state)
                 if applicable:
                     new_states = action.possible_outcomes(state) #, self.max_verbosity_level == 3)
-                    for new_state in new_states:
-                        self.log(3, f"[{state.hash()}] -- {bc.CYAN}{action.name}{bc.ENDC} ({action.cost}) -> [{new_state.hash()}]\n{new_state.pretty_str()}")
-                        if new_state in visited:
+                    for effects, new_state in zip(action.effects, new_states):
+                        if self.max_verbosity_level >= 3:
+                            self.log(3, f"[{state.hash()}] -- {bc.CYAN}{action.name}{bc.ENDC} ({action.cost}) -> [{new_state.hash()}]\n{new_state.pretty_str()}")
+                        # only the constraints on the variables changed by the action can be violated
+                        if not new_state.satisfies_constraints(self._domain.constraints_on(effects.keys())):
+                            if self.max_verbosity_level >= 3:
+                                self.log(3, f"[{new_state.hash()}] violates the constraints")
+                            pruned_states += 1
+                            if trace is not None:
+                                trace.record(trace.PRUNE, hash(new_state), hash(state), action.name, cur_state_cost + action.cost)
+                            continue
+
+                        new_cost = cur_state_cost + action.cost
+                        if new_state in visited or new_state in dead_ends:
+                            if trace is not None:
+                                trace.record(trace.DUPLICATE, hash(new_state), hash(state), action.name, new_cost)
                             continue
 
                         if new_state in open_pq:
                             # the state was already in the open queue,
                             # if this cost is better, we should update
                             # the open queue and the to_reach list
-                            old_cost = open_pq.get_value(new_state)
-                            new_cost = cur_state_cost + action.cost
+                            old_cost = g_costs[new_state]
                             if new_cost < old_cost:
-                                open_pq.update_value(new_state, new_cost)
-                                idx_in_to_reach = [i for i, v in enumerate(to_reach) if v[2] == new_state][0]
-                                to_reach[idx_in_to_reach] = (state, action.name, new_state)
+                                g_costs[new_state] = new_cost
+                                new_h = h_values[new_state] if heuristic is not None else 0
+                                open_pq.update_value(new_state, new_cost + new_h)
+                                to_reach[new_state] = (state, action.name)
+                                if trace is not None:
+                                    trace.record(trace.UPDATE, hash(new_state), hash(state), action.name, new_cost, new_h)
+                            elif trace is not None:
+                                trace.record(trace.DUPLICATE, hash(new_state), hash(state), action.name, new_cost)
                         else:
-                            open_pq.push(new_state, cur_state_cost + action.cost)
-                            to_reach.append((state, action.name, new_state))
+                            new_h = 0
+                            if heuristic is not None:
+                                new_h = heuristic(new_state)
+                                if new_h == math.inf:
+                                    # the goal cannot be reached from here
+                                    dead_ends.add(new_state)
+                                    dead_end_states += 1
+                                    if trace is not None:
+                                        trace.record(trace.PRUNE, hash(new_state), hash(state), action.name, new_cost, new_h)
+                                    continue
+                                h_values[new_state] = new_h
+                            g_costs[new_state] = new_cost
+                            open_pq.push(new_state, new_cost + new_h)
+                            to_reach[new_state] = (state, action.name)
+                            if trace is not None:
+                                trace.record(trace.GENERATE, hash(new_state), hash(state), action.name, new_cost, new_h)
                 else:
                     self.log(
                         3, f"{bc.CYAN}{action.name}{bc.ENDC} not applicable"
                     )
             if self.max_verbosity_level == 2:
                 self.log(2, "")
+            yield planning_iterations, cur_state_f, len(open_pq)
 
         self.log(1, f"Iterations: {planning_iterations}")
         self.log(1, f"Planning time: {(time.thread_time() - initial_time) * 1000.0:.3f} milliseconds")
-        if planner_result.plan is None:
-            self.log(1, f"{bc.ORANGE}Cannot find a plan{bc.ENDC}")
-            planner_result.outcome = PlannerOutcome.FAILURE
-        elif len(planner_result.plan) == 1:
-            self.log(1, f"{bc.BOLD}{bc.GREEN}=== ALREADY AT GOAL!!! ==={bc.ENDC}")
-            planner_result.outcome = PlannerOutcome.ALREADY_AT_GOAL
-        else:
-            planner_result.outcome = PlannerOutcome.SUCCESS
-            self.log(1, f"{bc.BOLD}{bc.GREEN}=== PLAN: ==={bc.ENDC}")
-            self.log(1, f"{planner_result.pretty_str(True)}")
-
-        planner_result.stats = {
-            "time": time.thread_time() - initial_time,
-            "iterations": planning_iterations,
-        }
-        return planner_result
+        for planner_result in planner_results:
+            if planner_result.plan is None and timed_out:
+                self.log(1, f"{bc.ORANGE}Cannot find a plan within {timeout} seconds{bc.ENDC}")
+                planner_result.outcome = PlannerOutcome.TIMEOUT
+            elif planner_result.plan is None:
+                self.log(1, f"{bc.ORANGE}Cannot find a plan{bc.ENDC}")
+                planner_result.outcome = PlannerOutcome.FAILURE
+            elif len(planner_result.plan) == 1:
+                self.log(1, f"{bc.BOLD}{bc.GREEN}=== ALREADY AT GOAL!!! ==={bc.ENDC}")
+                planner_result.outcome = PlannerOutcome.ALREADY_AT_GOAL
+            else:
+                planner_result.outcome = PlannerOutcome.SUCCESS
+                self.log(1, f"{bc.BOLD}{bc.GREEN}=== PLAN: ==={bc.ENDC}")
+                self.log(1, f"{planner_result.pretty_str(True)}")
+
+            planner_result.stats.update({
+                "time": time.thread_time() - initial_time,
+                "iterations": planning_iterations,
+                "pruned": pruned_states,
+                "dead_ends": dead_end_states,
+            })
+        if trace is not None:
+            trace.flush()
+        return planner_results
 
     def set_goal(self, goal):
         self._cur_goal = {"goal": goal.replace("\n", " ")}
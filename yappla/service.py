@@ -0,0 +1,287 @@
+"""A long-running local planning service.
+
+The server preloads one or more domains and answers plan requests coming
+from a Unix domain socket, so that many executors on the same host can
+share warm planners instead of building their own.
+
+The protocol is line based: every request and every response is a JSON
+object on a single line. A plan request looks like:
+
+    {"id": 1, "op": "plan", "domain": "warehouse", "state": {...}, "goal": "...", "timeout": 0.5}
+
+and its response:
+
+    {"id": 1, "outcome": "SUCCESS", "goal": "...", "plan": [[{...}, "action"], ..., [{...}, null]], "stats": {...}}
+
+The other requests are {"op": "stats"}, returning the throughput and the
+latency of the server, and {"op": "ping"}. Failed requests get a response
+with an "error" message.
+
+The server can be started with:
+
+    python3 -m yappla.service --socket /tmp/yappla.sock --domain warehouse=warehouse.yaml
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Dict, Optional
+
+from .domain import Domain
+from .plan import Plan, PlannerOutcome, PlannerResult
+from .planner import Planner
+from .state import State
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request = None
+            try:
+                request = json.loads(line)
+                response = self.server.planning_server.handle_request(request)
+            except Exception as exc:
+                request = request if isinstance(request, dict) else {}
+                response = {"error": f"{type(exc).__name__}: {exc}"}
+            if isinstance(request, dict) and "id" in request:
+                response["id"] = request["id"]
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class PlanningServer:
+    """Serves plan requests for a set of preloaded domains.
+
+    Plan requests are executed by a pool of `workers` threads, sharing a
+    single planner (and domain) for each domain name, so that nothing is
+    built while serving a request.
+    """
+
+    def __init__(self, socket_path: str, domains: Dict[str, Domain], workers: int = 4, default_timeout: Optional[float] = None):
+        """Constructor
+
+        Args:
+            socket_path (str): the path of the Unix domain socket to listen to
+            domains (dict): the domains to serve, by name
+            workers (int): the number of requests that can be planned concurrently
+            default_timeout (float): the deadline (in seconds) of the requests
+                that do not specify their own "timeout"; the deadline starts
+                when the request is received, the requests still waiting for
+                a worker when it expires get a TIMEOUT
+        """
+        self.socket_path = socket_path
+        self.domains = domains
+        self.workers = workers
+        self.default_timeout = default_timeout
+        self._planners = {}
+        for name, domain in domains.items():
+            planner = Planner()
+            planner.set_domain(domain)
+            self._planners[name] = planner
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self._server = None
+        self._stats_lock = threading.Lock()
+        self._start_time = time.monotonic()
+        self._requests = 0
+        self._errors = 0
+        self._outcomes = collections.Counter()
+        self._latencies = collections.deque(maxlen=1000)
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _UnixServer(self.socket_path, _RequestHandler)
+        self._server.planning_server = self
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._executor.shutdown(wait=True)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        """Stops `serve_forever`, to be called from another thread."""
+        if self._server is not None:
+            self._server.shutdown()
+
+    def handle_request(self, request: Dict) -> Dict:
+        op = request.get("op", "plan")
+        if op == "ping":
+            return {"pong": True}
+        if op == "stats":
+            return self.stats()
+        if op != "plan":
+            raise ValueError(f"Unknown operation '{op}'")
+        start_time = time.monotonic()
+        # the deadline includes the time spent waiting for a worker
+        timeout = request.get("timeout", self.default_timeout)
+        deadline = start_time + timeout if timeout is not None else None
+        try:
+            future = self._executor.submit(self._plan, request, deadline)
+            try:
+                response = future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except concurrent.futures.TimeoutError:
+                # a running search stops by itself at the deadline
+                response = self._timeout_response(request) if future.cancel() else future.result()
+        except Exception:
+            with self._stats_lock:
+                self._errors += 1
+            raise
+        with self._stats_lock:
+            self._requests += 1
+            self._outcomes[response["outcome"]] += 1
+            self._latencies.append(time.monotonic() - start_time)
+        return response
+
+    def stats(self) -> Dict:
+        """Returns the throughput (requests per second since the start) and
+        the latency (in seconds, over the last 1000 requests) of the server."""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            uptime = time.monotonic() - self._start_time
+            stats = {
+                "uptime": uptime,
+                "requests": self._requests,
+                "errors": self._errors,
+                "outcomes": dict(self._outcomes),
+                "throughput": self._requests / uptime if uptime > 0 else 0.0,
+            }
+        if latencies:
+            stats["latency"] = {
+                "mean": sum(latencies) / len(latencies),
+                "p50": latencies[len(latencies) // 2],
+                "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "max": latencies[-1],
+            }
+        return stats
+
+    def _timeout_response(self, request: Dict) -> Dict:
+        return {"outcome": PlannerOutcome.TIMEOUT.name, "goal": request["goal"], "plan": None, "stats": {"iterations": 0}}
+
+    def _plan(self, request: Dict, deadline: Optional[float]) -> Dict:
+        planner = self._planners.get(request["domain"], None)
+        if planner is None:
+            raise ValueError(f"Unknown domain '{request['domain']}'")
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return self._timeout_response(request)
+        planner_result = planner.plan(State(request["state"]), request["goal"], timeout)
+        return {
+            "outcome": planner_result.outcome.name,
+            "goal": planner_result.goal,
+            "plan": None if planner_result.plan is None else [[dict(s), a] for s, a in planner_result.plan],
+            "stats": planner_result.stats,
+        }
+
+
+class PlanningClient:
+    """A client of the PlanningServer, it can be shared among threads (the
+    requests are sent one at a time)."""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(socket_path)
+        self._file = self._socket.makefile("rwb")
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def request(self, request: Dict) -> Dict:
+        with self._lock:
+            self._next_id += 1
+            request = {**request, "id": self._next_id}
+            self._file.write(json.dumps(request).encode("utf-8") + b"\n")
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            raise ConnectionError("The planning server closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    def plan(self, domain: str, initial_state: "State", goal: str, timeout: Optional[float] = None) -> PlannerResult:
+        """Asks the server to plan in the domain `domain`, the result has the
+        same content of the one returned by `Planner.plan`."""
+        request = {"op": "plan", "domain": domain, "state": dict(initial_state), "goal": goal}
+        if timeout is not None:
+            request["timeout"] = timeout
+        response = self.request(request)
+        planner_result = PlannerResult(None)
+        planner_result.outcome = PlannerOutcome[response["outcome"]]
+        planner_result.goal = response["goal"]
+        if response["plan"] is not None:
+            planner_result.plan = Plan((State(s), a) for s, a in response["plan"])
+        planner_result.stats = response["stats"]
+        return planner_result
+
+    def stats(self) -> Dict:
+        return self.request({"op": "stats"})
+
+
+def _load_definition(path):
+    with open(path) as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError(f"PyYAML is needed to load '{path}'")
+        return yaml.safe_load(f)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="YAPPLA planning service")
+    parser.add_argument("--socket", required=True, help="path of the Unix domain socket")
+    parser.add_argument(
+        "--domain", action="append", required=True, metavar="NAME=FILE",
+        help="a domain to serve, defined in a YAML or JSON file (can be repeated)")
+    parser.add_argument("--workers", type=int, default=4, help="number of planning threads")
+    parser.add_argument("--timeout", type=float, default=None, help="default deadline of the requests (seconds)")
+    parser.add_argument("--compiled-dir", default=None, help="where to keep the compiled domains")
+    args = parser.parse_args(args)
+
+    domains = {}
+    for d in args.domain:
+        name, path = d.split("=", 1)
+        compiled_path = None
+        if args.compiled_dir is not None:
+            compiled_path = os.path.join(args.compiled_dir, f"{name}.ydc")
+        domain = Domain()
+        domain.load_from_dict(_load_definition(path), compiled_path=compiled_path)
+        domains[name] = domain
+
+    server = PlanningServer(args.socket, domains, workers=args.workers, default_timeout=args.timeout)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
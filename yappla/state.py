@@ -1,10 +1,38 @@
 import hashlib
 import base64
+from collections.abc import Mapping
 from typing import Dict, List, Union
 
 from .utils import bc, eval_expression
 
 
+# shared by all the threads: the keys are only added, always with the same
+# value for the same assignment, so concurrent updates are harmless
+_ZOBRIST_KEYS = {}
+_MISSING = object()
+
+
+def _zobrist_key(variable, value) -> int:
+    """Returns the (64 bits) random key of the assignment variable = value; the
+    keys are derived from the assignment itself, so they are the same in
+    every process."""
+    key = _ZOBRIST_KEYS.get((variable, value), None)
+    if key is None:
+        digest = hashlib.blake2b(repr((variable, value)).encode("utf-8"), digest_size=8).digest()
+        key = int.from_bytes(digest, "little")
+        _ZOBRIST_KEYS[(variable, value)] = key
+    return key
+
+
+def zobrist_hash(state: Mapping) -> int:
+    """The Zobrist hash of a state, i.e. the xor of the keys of all its
+    assignments: it can be updated incrementally when a variable changes."""
+    h = 0
+    for item in state.items():
+        h ^= _zobrist_key(*item)
+    return h
+
+
 class State(dict):
     """A State is a dictionary encoding a possible state of the system, that is
     a particular (complete) assignment of all the state variables (the state
@@ -71,6 +99,168 @@ class State(dict):
                 return "\n".join(lines)
 
     def hash(self):
-        h = hashlib.md5()
-        h.update(str(frozenset(self.items())).encode("ascii"))
-        return h.hexdigest()[-6:]
+        return f"{zobrist_hash(self):016x}"[-6:]
+
+
+class DeltaState(Mapping):
+    """An immutable state, stored as a reference to a parent state plus the
+    assignments that changed with respect to it.
+
+    Applying an action to a DeltaState costs O(|effects|), both for building
+    the new state and for updating its (Zobrist) hash, instead of copying the
+    whole state. When the chain of parents becomes longer than `max_depth`,
+    the state is materialized (i.e., it stores all the assignments again), so
+    that looking up a variable never walks more than `max_depth` states.
+
+    DeltaStates can be used as dict keys and compared with each other and
+    with plain States.
+    """
+
+    __slots__ = ("_parent", "_changes", "_depth", "_max_depth", "_zobrist")
+
+    def __init__(self, state: Mapping = None, max_depth: int = 32):
+        self._parent = None
+        self._changes = dict(state) if state is not None else {}
+        self._depth = 0
+        self._max_depth = max_depth
+        self._zobrist = zobrist_hash(self._changes)
+
+    def apply(self, effects: Dict) -> "DeltaState":
+        """Returns the state resulting from assigning the `effects` to this state."""
+        changes = {}
+        h = self._zobrist
+        for v, value in effects.items():
+            try:
+                old_value = self[v]
+            except KeyError:
+                h ^= _zobrist_key(v, value)
+            else:
+                if old_value == value:
+                    continue
+                h ^= _zobrist_key(v, old_value) ^ _zobrist_key(v, value)
+            changes[v] = value
+        if not changes:
+            return self
+        new_state = DeltaState.__new__(DeltaState)
+        new_state._max_depth = self._max_depth
+        new_state._zobrist = h
+        if self._depth >= self._max_depth:
+            new_state._parent = None
+            new_state._changes = {**self._materialize(), **changes}
+            new_state._depth = 0
+        else:
+            new_state._parent = self
+            new_state._changes = changes
+            new_state._depth = self._depth + 1
+        return new_state
+
+    def _materialize(self) -> Dict:
+        chain = []
+        node = self
+        while node is not None:
+            chain.append(node._changes)
+            node = node._parent
+        assignments = {}
+        for changes in reversed(chain):
+            assignments.update(changes)
+        return assignments
+
+    def to_state(self) -> State:
+        return State(self._materialize())
+
+    def __getitem__(self, key):
+        node = self
+        while node is not None:
+            changes = node._changes
+            if key in changes:
+                return changes[key]
+            node = node._parent
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        node = self
+        while node is not None:
+            if key in node._changes:
+                return True
+            node = node._parent
+        return False
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def keys(self):
+        return self._materialize().keys()
+
+    def items(self):
+        return self._materialize().items()
+
+    def values(self):
+        return self._materialize().values()
+
+    def __len__(self):
+        return len(self._materialize())
+
+    def __hash__(self):
+        return self._zobrist
+
+    def _chain(self) -> List["DeltaState"]:
+        """This state and its ancestors, up to the (materialized) root."""
+        chain = []
+        node = self
+        while node is not None:
+            chain.append(node)
+            node = node._parent
+        return chain
+
+    def _equals(self, other: "DeltaState") -> bool:
+        """Compares two DeltaStates without materializing them: only the
+        variables changed after their last common ancestor (or, if they have
+        different roots, the ones changed after the roots and the roots
+        themselves) are compared."""
+        chain = self._chain()
+        other_chain = other._chain()
+        other_nodes = {id(node) for node in other_chain}
+        common = next((node for node in chain if id(node) in other_nodes), None)
+        changed = set()
+        for nodes in (chain, other_chain):
+            for node in nodes:
+                if node is common or node._parent is None:
+                    break
+                changed.update(node._changes)
+        for v in changed:
+            if self.get(v, _MISSING) != other.get(v, _MISSING):
+                return False
+        if common is not None:
+            return True
+        root = chain[-1]._changes
+        other_root = other_chain[-1]._changes
+        for v, value in root.items():
+            if v not in changed and other_root.get(v, _MISSING) != value:
+                return False
+        for v in other_root:
+            if v not in changed and v not in root:
+                return False
+        return True
+
+    def __eq__(self, other):
+        if isinstance(other, DeltaState):
+            if self is other:
+                return True
+            if self._zobrist != other._zobrist:
+                return False
+            return self._equals(other)
+        if isinstance(other, Mapping):
+            return self._materialize() == dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self._materialize())
+
+    def hash(self):
+        return f"{self._zobrist:016x}"[-6:]
+
+    satisfies_constraints = State.satisfies_constraints
+    satisfies_conditions = State.satisfies_conditions
+
+    def pretty_str(self, columns: bool = True, show_hashes: bool = False, diff_with: "State" = None) -> str:
+        return self.to_state().pretty_str(columns, show_hashes, diff_with)
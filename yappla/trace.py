@@ -0,0 +1,180 @@
+import collections
+import json
+import math
+import time
+from typing import Dict, IO, List, Union
+
+
+# bump this every time the content of the records changes
+TRACE_FORMAT_VERSION = 1
+
+
+class SearchTraceWriter:
+    """Writes the events of a search to a stream, to be analyzed offline
+    (see SearchTrace).
+
+    The trace is a JSON lines file: the first line is a header, every other
+    line is a record [kind, state id, parent id, action, g, h, timestamp],
+    where kind is one of EXPAND, GENERATE, DUPLICATE, UPDATE and PRUNE, the
+    ids are the hashes of the states and the timestamp is in seconds since
+    the start of the trace.
+
+    The records are buffered and written `buffer_records` at a time.
+    """
+
+    EXPAND = "E"
+    GENERATE = "G"
+    DUPLICATE = "D"
+    UPDATE = "U"
+    PRUNE = "P"
+
+    def __init__(self, stream: Union[str, IO[str]], buffer_records: int = 4096):
+        """Constructor
+
+        Args:
+            stream (str or file): the path of the trace file, or an already
+                opened text stream (it is not closed by `close`)
+            buffer_records (int): the number of records kept in memory before
+                writing them to the stream
+        """
+        if isinstance(stream, str):
+            self._stream = open(stream, "w", buffering=1 << 16)
+            self._owns_stream = True
+        else:
+            self._stream = stream
+            self._owns_stream = False
+        self.buffer_records = buffer_records
+        self._buffer = []
+        self._action_names = {None: "null"}
+        self._start_time = time.perf_counter()
+        self._header_written = False
+
+    def begin(self, goal: str = None):
+        """Writes the header, it is called by the planner at the beginning of
+        the search. A writer records a single search: reusing it for another
+        one raises a RuntimeError, since the records of the two searches could
+        not be told apart."""
+        if self._header_written:
+            raise RuntimeError("A SearchTraceWriter can record only one search, create a new one for each search")
+        self._header_written = True
+        header = {"format_version": TRACE_FORMAT_VERSION, "goal": goal}
+        self._buffer.append(json.dumps(header) + "\n")
+
+    def record(self, kind: str, state_id: int, parent_id: int = None, action: str = None, g: float = 0, h: float = 0):
+        action_name = self._action_names.get(action, None)
+        if action_name is None:
+            action_name = self._action_names[action] = json.dumps(action)
+        if h == math.inf:
+            h = "Infinity"  # as written by the json module for dead ends
+        self._buffer.append(
+            f'["{kind}",{state_id},{"null" if parent_id is None else parent_id},{action_name},{g},{h},'
+            f"{time.perf_counter() - self._start_time:.6f}]\n"
+        )
+        if len(self._buffer) >= self.buffer_records:
+            self.flush()
+
+    def flush(self):
+        self._stream.writelines(self._buffer)
+        self._buffer = []
+        self._stream.flush()
+
+    def close(self):
+        self.flush()
+        if self._owns_stream:
+            self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SearchTrace:
+    """A search trace read back from a file written by SearchTraceWriter.
+
+    It rebuilds the search tree (the parent of every state is the one of the
+    last GENERATE or UPDATE event of the state) and computes some statistics
+    on it.
+    """
+
+    def __init__(self, header: Dict, records: List[list]):
+        self.header = header
+        self.records = records
+        self.parents = {}  # state id -> (parent id, action)
+        self.costs = {}  # state id -> (g, h)
+        self.expanded = []
+        for kind, state_id, parent_id, action, g, h, _ in records:
+            if kind == SearchTraceWriter.EXPAND:
+                self.expanded.append(state_id)
+                self.parents.setdefault(state_id, (None, None))
+                self.costs[state_id] = (g, h)
+            elif kind in [SearchTraceWriter.GENERATE, SearchTraceWriter.UPDATE]:
+                self.parents[state_id] = (parent_id, action)
+                self.costs[state_id] = (g, h)
+        self._depths = {}
+
+    @staticmethod
+    def load(stream: Union[str, IO[str]]) -> "SearchTrace":
+        if isinstance(stream, str):
+            with open(stream) as f:
+                return SearchTrace.load(f)
+        header = json.loads(stream.readline())
+        if header.get("format_version") != TRACE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported trace format version {header.get('format_version')}")
+        records = [json.loads(line) for line in stream if line.strip()]
+        return SearchTrace(header, records)
+
+    def depth(self, state_id: int) -> int:
+        """The number of actions from the initial state to the state in the search tree."""
+        chain = []
+        while state_id not in self._depths:
+            parent_id, _ = self.parents.get(state_id, (None, None))
+            if parent_id is None:
+                self._depths[state_id] = 0
+                break
+            chain.append(state_id)
+            state_id = parent_id
+        depth = self._depths[state_id]
+        for s in reversed(chain):
+            depth += 1
+            self._depths[s] = depth
+        return depth
+
+    def path(self, state_id: int) -> List[str]:
+        """The actions leading from the initial state to the state in the search tree."""
+        actions = []
+        parent_id, action = self.parents.get(state_id, (None, None))
+        while parent_id is not None:
+            actions.append(action)
+            parent_id, action = self.parents.get(parent_id, (None, None))
+        actions.reverse()
+        return actions
+
+    def branching_factors(self) -> Dict[int, float]:
+        """The average number of states generated by the expansion of a state,
+        for each depth of the expanded states."""
+        expansions = collections.Counter()
+        generated = collections.Counter()
+        for state_id in self.expanded:
+            expansions[self.depth(state_id)] += 1
+        for kind, _, parent_id, _, _, _, _ in self.records:
+            if kind == SearchTraceWriter.GENERATE and parent_id is not None:
+                generated[self.depth(parent_id)] += 1
+        return {depth: generated[depth] / n for depth, n in sorted(expansions.items())}
+
+    def action_stats(self) -> Dict[str, Dict[str, int]]:
+        """For each action, the number of generated, duplicate, updated and
+        pruned states."""
+        names = {
+            SearchTraceWriter.GENERATE: "generated",
+            SearchTraceWriter.DUPLICATE: "duplicates",
+            SearchTraceWriter.UPDATE: "updates",
+            SearchTraceWriter.PRUNE: "pruned",
+        }
+        stats = {}
+        for kind, _, _, action, _, _, _ in self.records:
+            if kind in names and action is not None:
+                action_stats = stats.setdefault(action, {name: 0 for name in names.values()})
+                action_stats[names[kind]] += 1
+        return stats
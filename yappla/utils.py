@@ -1,40 +1,59 @@
 import ast
-from typing import Union
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import pickle
+import threading
+from typing import Dict, FrozenSet, Union
 
-from simpleeval import SimpleEval, simple_eval
+from simpleeval import DEFAULT_FUNCTIONS, DEFAULT_OPERATORS, SimpleEval, simple_eval
 
 
 class PriorityQueue:
-    """Very simple priority queue"""
+    """Very simple priority queue (a binary heap), the items have to be
+    hashable. Items with the same value are popped in insertion order."""
+
+    _REMOVED = object()
 
     def __init__(self):
-        self.queue = []
+        self.queue = []  # heap of [value, insertion counter, item]
+        self._entries = {}
+        self._counter = itertools.count()
 
     def push(self, item, value):
-        self.queue.append([item, value])
-        self.queue.sort(key=lambda x: x[1])
+        entry = [value, next(self._counter), item]
+        self._entries[item] = entry
+        heapq.heappush(self.queue, entry)
 
     def pop(self):
-        return self.queue.pop(0)
+        while self.queue:
+            value, _, item = heapq.heappop(self.queue)
+            if item is not PriorityQueue._REMOVED:
+                del self._entries[item]
+                return item, value
+        raise IndexError("pop from an empty priority queue")
 
     def get_value(self, item):
-        return [v[1] for v in self.queue if v[0] == item][0]
+        return self._entries[item][0]
 
     def update_value(self, item, value):
-        for s in self.queue:
-            if s[0] == item:
-                s[1] = value
-                break
-        self.queue.sort(key=lambda x: x[1])
+        # the old entry stays in the heap, marked as removed
+        self._entries.pop(item)[2] = PriorityQueue._REMOVED
+        self.push(item, value)
 
     def __contains__(self, item):
-        return item in (x[0] for x in self.queue)
+        return item in self._entries
 
     def empty(self):
-        return len(self.queue) == 0
+        return len(self._entries) == 0
+
+    def __len__(self):
+        return len(self._entries)
 
     def __repr__(self):
-        return "PRIORITY QUEUE {\n" + "\n".join(str((i, c)) for i, c in self.queue) + "\n}"
+        return "PRIORITY QUEUE {\n" + "\n".join(str((i, c)) for c, _, i in sorted(self._entries.values())) + "\n}"
 
 
 class bc:
@@ -54,23 +73,117 @@ class bc:
 
 
 class CompiledExpression(SimpleEval):
-    def __init__(self, expr, operators=None, functions=None, names=None):
-        super().__init__(operators=operators, functions=functions, names=names)
+    """An expression parsed once and evaluated many times.
+
+    `eval_in_state` is thread-safe and re-entrant: the expression itself is
+    never modified by the evaluation (its variables are computed when it is
+    built), every thread evaluates it with its own evaluator (kept in
+    thread-local storage), so the same CompiledExpression can be evaluated
+    concurrently in different states. It only keeps the `operators` and the
+    `functions` of its evaluators, it cannot be evaluated with the methods
+    of SimpleEval.
+    """
+
+    def __init__(self, expr, operators=None, functions=None, names=None, compiled_ast_tree=None):
+        # the evaluators are built by eval_in_state, in each thread, with these
+        # operators and functions (the defaults are shared, not copied)
+        self.operators = operators if operators is not None else DEFAULT_OPERATORS
+        self.functions = functions if functions is not None else DEFAULT_FUNCTIONS
+        self.names = names if names is not None else {}
         expr = expr.replace("\n", " ")
-        try:
-            self.compiled_ast_tree = ast.parse(expr.strip()).body[0].value
-        except Exception as exc:
-            raise Exception("Cannot parse expression '%s': %s" % (expr.strip(), exc))
+        if compiled_ast_tree is None:
+            try:
+                compiled_ast_tree = ast.parse(expr.strip()).body[0].value
+            except Exception as exc:
+                raise Exception("Cannot parse expression '%s': %s" % (expr.strip(), exc))
+        self.compiled_ast_tree = compiled_ast_tree
         self.expression = expr
+        self.expr = expr
+        self._variables = frozenset(
+            node.id for node in ast.walk(compiled_ast_tree) if isinstance(node, ast.Name)
+        )
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # only the source, the parsed tree, its variables and the operators
+        # and functions that are not the default ones are stored
+        return {
+            "expression": self.expression,
+            "compiled_ast_tree": self.compiled_ast_tree,
+            "_variables": self.variables,
+            "operators": None if self.operators is DEFAULT_OPERATORS else self.operators,
+            "functions": None if self.functions is DEFAULT_FUNCTIONS else self.functions,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.operators is None:
+            self.operators = DEFAULT_OPERATORS
+        if self.functions is None:
+            self.functions = DEFAULT_FUNCTIONS
+        self.names = {}
+        self.expr = self.expression
+        self._local = threading.local()
+
+    @property
+    def variables(self) -> FrozenSet[str]:
+        """The names (i.e., the state variables) referenced by the expression."""
+        return self._variables
 
     def eval_in_state(self, state: "State") -> bool:
-        self.names = state
-        return self._eval(self.compiled_ast_tree)
+        try:
+            evaluator = self._local.evaluator
+        except AttributeError:
+            # the shared expression is never modified by the evaluation
+            evaluator = SimpleEval(operators=self.operators, functions=self.functions)
+            evaluator.expr = self.expression
+            self._local.evaluator = evaluator
+        # the evaluator might be already in use in this thread (e.g., by a
+        # function called from the expression itself)
+        prev_names = evaluator.names
+        evaluator.names = state
+        try:
+            return evaluator._eval(self.compiled_ast_tree)
+        finally:
+            evaluator.names = prev_names
 
     def __repr__(self) -> str:
         return "COMPILED EXPRESSION {" + self.expression + "}"
 
 
+def share_subtrees(tree, table: Dict):
+    """Returns a copy of the (expression) AST `tree`, without the positions in
+    the source, in which every subtree equal to one already in `table` is
+    replaced by that one (the new subtrees are added to `table`).
+
+    The trees are never modified by the evaluation, so the expressions of a
+    domain can share them: this makes the compiled domain artifacts much
+    smaller and faster to load.
+    """
+    if isinstance(tree, list):
+        return [share_subtrees(t, table) for t in tree]
+    if not isinstance(tree, ast.AST):
+        return tree
+    fields = [share_subtrees(getattr(tree, f, None), table) for f in tree._fields]
+    try:
+        key = (type(tree), tuple(_subtree_key(f) for f in fields))
+        hash(key)
+    except TypeError:
+        return type(tree)(*fields)
+    node = table.get(key, None)
+    if node is None:
+        node = table[key] = type(tree)(*fields)
+    return node
+
+
+def _subtree_key(field):
+    if isinstance(field, ast.AST):
+        return id(field)  # the subtrees are already shared
+    if isinstance(field, list):
+        return tuple(_subtree_key(f) for f in field)
+    return (type(field), field)
+
+
 def eval_expression(expression: Union[str, CompiledExpression], state: "State") -> bool:
     """Evaluate the given boolean expression in a state.
 
@@ -85,6 +198,50 @@ def eval_expression(expression: Union[str, CompiledExpression], state: "State")
         return None
 
 
+def definition_hash(definition) -> str:
+    """Returns a content hash of a (domain) definition, i.e. of a structure
+    made of dicts, lists and scalars such as the ones loaded from YAML.
+
+    The hash does not depend on the order of the keys of the dicts.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(definition, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def save_artifact(path: str, header: Dict, content):
+    """Writes `content` to the file `path` as a pickle, preceded by a small
+    pickled `header` (e.g., a format version and the hash of what the
+    content has been built from), so that `load_artifact` can detect stale
+    files without loading them entirely. The file is replaced atomically."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(content, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # never leave a half written file around
+    os.replace(tmp_path, path)
+
+
+def load_artifact(path: str, expected_header: Dict):
+    """Loads the content of a file written by `save_artifact`.
+
+    Returns None if the file is missing or unreadable, or if its header
+    does not have all the items of `expected_header`. The files are
+    pickles: only load the ones you wrote yourself.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = pickle.load(f)
+            if not isinstance(header, dict):
+                return None
+            for key, value in expected_header.items():
+                if header.get(key, None) != value:
+                    return None
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+
 def diff_dicts(a, b, missing=KeyError):
     """
     From: https://stackoverflow.com/questions/32815640/how-to-get-the-difference-between-two-dictionaries-in-python